@@ -35,10 +35,13 @@ setup(
     license='MIT',
     entry_points={
         'console_scripts': [
+            'ultrastar = ultrastar_scripts.__main__:main',
             'ultrastar-check = ultrastar_scripts.check:main',
+            'ultrastar-export-notes = ultrastar_scripts.export_notes:main',
             'ultrastar-fix-linebreaks = ultrastar_scripts.fix_linebreaks:main',
             'ultrastar-fix-whitespace = ultrastar_scripts.fix_whitespace:main',
             'ultrastar-multiply-bpm = ultrastar_scripts.multiply_bpm:main',
+            'ultrastar-pipeline = ultrastar_scripts.pipeline:main',
             'ultrastar-split-lyrics = ultrastar_scripts.split_lyrics:main',
             'ultrastar-songlist-csv = ultrastar_scripts.songlist_csv:main',
             'ultrastar-songlist-json = ultrastar_scripts.songlist_json:main'
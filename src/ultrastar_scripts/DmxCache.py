@@ -0,0 +1,64 @@
+import json
+import os
+from pathlib import Path
+
+# Compiled DMX config: the entries of every YAML file plus the resolved same-as links, stored
+# as one JSON file. Entries are kept per file and reused while the mtime and size of that file
+# are unchanged; the same-as links only while the list of files is exactly the same.
+class DmxCache:
+    # bump this when the layout of the file or the fields of an entry change
+    CACHE_FORMAT = 1
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.__key = None
+        self.__files = {}
+        self.__sameas = {}
+        self.__warnings = []
+        try:
+            with open(self.path) as reader:
+                data = json.load(reader)
+            if data['format'] == self.CACHE_FORMAT:
+                self.__key = data['key']
+                self.__files = {p: (mtime, size, entries) for (p, mtime, size), entries in zip(data['key'], data['entries'])}
+                self.__sameas = {position: target for position, target in data['same-as']}
+                self.__warnings = data['warnings']
+        except (OSError, ValueError, KeyError, TypeError):
+            # a missing or broken cache is simply an empty one
+            pass
+
+    # (path, mtime, size) of the files, in the order they are loaded
+    @staticmethod
+    def key(files: [Path]) -> list:
+        key = []
+        for p in files:
+            stat = p.stat()
+            key.append([str(p), stat.st_mtime_ns, stat.st_size])
+        return key
+
+    # returns the entries of one file, or None if it has to be loaded again
+    def get(self, path: str, mtime: int, size: int):
+        cached = self.__files.get(path)
+        if cached is None or cached[0] != mtime or cached[1] != size:
+            return None
+        return cached[2]
+
+    # returns (sameas, warnings) if no file was added, removed or changed, otherwise None
+    def resolved(self, key: list):
+        if key != self.__key:
+            return None
+        return self.__sameas, self.__warnings
+
+    # entries holds the entries of every file in key, sameas maps the position of every
+    # same-as entry to the position it resolves to, or None
+    def save(self, key: list, entries: [[dict]], sameas: dict, warnings: [str]):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as writer:
+            json.dump({
+                'format': self.CACHE_FORMAT,
+                'key': key,
+                'entries': entries,
+                'same-as': sorted(sameas.items()),
+                'warnings': warnings
+            }, writer, separators=(',', ':'))
+        os.replace(tmp, self.path)
@@ -0,0 +1,259 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from ultrastar_scripts.libultrastar import (
+    End,
+    Linebreak,
+    Note,
+    PlayerChange,
+    Stats,
+    Tag,
+    findSongFiles,
+    parseFloat,
+    phase,
+    print_error,
+    readLines,
+    tokenize
+)
+
+# The notes of a whole library as NumPy columns, one .npy file per column, with one row per
+# note. The rows of a song are contiguous; songs.json holds the song table: the metadata
+# SonglistGenerator reads, plus where the notes of the song are in the columns. The columns
+# are opened memory-mapped, so a question about millions of notes does not read them all
+# into memory, and no txt file is read at all.
+#
+# update() only parses files whose mtime or size changed since the previous update; when the
+# DMX config changed, the song table of the other files is read again, but not their notes. Every
+# update writes a new generation of column files and switches songs.json over to it at the
+# end, so a reader that has the previous generation open keeps a consistent view.
+
+# column -> dtype; type is the note type character (':', '*', 'F', ...) as a byte, player
+# the number of the P line the note is under (1 without P lines; P0 counts as the highest
+# player so far, like in check), line is 1-based, first is 1 for the first note of the song
+# and after every P line, and linebreak the start of the linebreak before the note that
+# check compares the note with, NO_LINEBREAK if there is none
+COLUMNS = {
+    'song': np.int32,
+    'start': np.int32,
+    'length': np.int32,
+    'pitch': np.int32,
+    'type': np.uint8,
+    'player': np.uint8,
+    'line': np.int32,
+    'first': np.uint8,
+    'linebreak': np.int32
+}
+
+NO_LINEBREAK = np.iinfo(np.int32).min
+
+# reads the notes of one file, returns the columns without song, the #BPM and the number of
+# players
+def readNotes(path) -> (dict, float, int):
+    columns = {name: [] for name in COLUMNS if name != 'song'}
+    bpm = None
+    player = 1
+    players = 1
+    # like CheckContext: a linebreak is pending until a note that follows a note of the
+    # same player
+    prevnote = False
+    linebreak = None
+    for event in tokenize(readLines(path)):
+        if isinstance(event, Note):
+            columns['linebreak'].append(NO_LINEBREAK if linebreak is None else linebreak)
+            columns['first'].append(not prevnote)
+            if prevnote:
+                linebreak = None
+            prevnote = True
+            columns['start'].append(event.start)
+            columns['length'].append(event.length)
+            columns['pitch'].append(event.pitch)
+            columns['type'].append(ord(event.type))
+            columns['player'].append(player)
+            columns['line'].append(event.index + 1)
+        elif isinstance(event, Linebreak):
+            linebreak = event.start
+        elif isinstance(event, Tag):
+            # the last one counts, like in check
+            if event.key == 'BPM' and event.value:
+                bpm = parseFloat(event.value)
+        elif isinstance(event, PlayerChange):
+            prevnote = False
+            linebreak = None
+            players = max(players, event.player)
+            player = event.player or players
+        elif isinstance(event, End):
+            break
+    return {name: np.array(values, dtype=COLUMNS[name]) for name, values in columns.items()}, bpm, players
+
+class NoteStore:
+    # bump this when the layout of the song table or a column changes
+    STORE_FORMAT = 2
+    SONGS_FILENAME = 'songs.json'
+    NO_LINEBREAK = NO_LINEBREAK
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.generation = 0
+        # DmxCache.key of the DMX config the song table was made with
+        self.dmx = None
+        # dicts with id, path, mtime, size, artist, title, language, year, songtype, dmx, bpm,
+        # players and offset and count of the notes in the columns, sorted by path
+        self.songs = []
+        self.columns = {}
+        try:
+            with open(self.path / self.SONGS_FILENAME) as reader:
+                data = json.load(reader)
+            if data['format'] == self.STORE_FORMAT:
+                self.generation = data['generation']
+                self.dmx = data.get('dmx')
+                self.songs = data['songs']
+                self.columns = {name: np.load(self.__column(name), mmap_mode='r') for name in COLUMNS}
+        except (OSError, ValueError, KeyError):
+            # a missing or broken store is simply an empty one
+            self.generation = 0
+            self.dmx = None
+            self.songs = []
+            self.columns = {}
+        if not self.columns:
+            self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def __column(self, name: str, generation: int = None) -> Path:
+        return self.path / '{}-{}.npy'.format(name, self.generation if generation is None else generation)
+
+    def __len__(self) -> int:
+        return len(self.columns['song'])
+
+    # the columns of the notes of one song, as views into the store
+    def notes(self, song: dict) -> dict:
+        rows = slice(song['offset'], song['offset'] + song['count'])
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    # Brings the store up to date with the txt files below paths. generator is the
+    # SonglistGenerator whose _loadSong() provides the song table, so its DMX config counts.
+    # Returns the number of files that were read, kept, removed and that failed; a file that
+    # fails is reported and left out of the store, also if an earlier version of it was in it.
+    def update(self, paths: [str], generator, ignore: [str] = (), jobs: int = 1, stats: Stats = None) -> (int, int, int, int):
+        from ultrastar_scripts.DmxCache import DmxCache
+        dmx = DmxCache.key(generator._dmxFiles())
+        # the dmx of every song depends on it, the notes do not
+        refresh = dmx != self.dmx
+        known = {song['path']: song for song in self.songs}
+        nextid = max((song['id'] for song in self.songs), default=-1) + 1
+        kept = []
+        changed = []
+        failed = 0
+        # songs of the store that are left out although their file is still there: files
+        # that are no longer song files count as removed, files that fail as failed
+        removed = 0
+        dropped = 0
+        files = findSongFiles(paths, ignore)
+        if stats is not None:
+            files = stats.iterate('walk', files)
+        for p in sorted(files):
+            stat = p.stat()
+            # absolute, like SonglistIndex, so the store can be updated from any directory
+            key = os.path.abspath(p)
+            song = known.pop(key, None)
+            unchanged = song is not None and song['mtime'] == stat.st_mtime_ns and song['size'] == stat.st_size
+            if unchanged and not refresh:
+                kept.append(song)
+                continue
+            try:
+                loaded = generator._loadSong(p)
+            except Exception as e:
+                # one broken file should not stop the export of the whole library
+                print_error('{}: {}'.format(p, e))
+                failed += 1
+                dropped += song is not None
+                continue
+            if loaded is None:
+                removed += song is not None
+                dropped += song is not None
+                continue
+            metadata = {
+                'artist': loaded.artist,
+                'title': loaded.title,
+                'language': loaded.language,
+                'year': loaded.year,
+                'songtype': int(loaded.songtype),
+                'dmx': loaded.dmx
+            }
+            if unchanged:
+                kept.append(dict(song, **metadata))
+                continue
+            changed.append((dict({
+                # a file keeps its id when it changes
+                'id': song['id'] if song is not None else None,
+                'path': key,
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size
+            }, **metadata), p, song is not None))
+        with phase(stats, 'parse'):
+            if jobs > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    parsed = list(executor.map(_readNotesSafely, [p for song, p, tracked in changed], chunksize=16))
+            else:
+                parsed = list(map(_readNotesSafely, [p for song, p, tracked in changed]))
+
+        read = []
+        for (song, p, tracked), result in zip(changed, parsed):
+            if result is None:
+                failed += 1
+                dropped += tracked
+                continue
+            columns, song['bpm'], song['players'] = result
+            if song['id'] is None:
+                song['id'] = nextid
+                nextid += 1
+            read.append((song, columns))
+        if read or known or dropped or refresh:
+            with phase(stats, 'write'):
+                self.__write(kept, read, dmx)
+        return len(read), len(kept), len(known) + removed, failed
+
+    def __write(self, kept: [dict], read: [(dict, dict)], dmx: list):
+        entries = [(song, None) for song in kept] + read
+        entries.sort(key=lambda entry: entry[0]['path'])
+        generation = self.generation + 1
+        self.path.mkdir(parents=True, exist_ok=True)
+        songs = []
+        offset = 0
+        parts = {name: [] for name in COLUMNS}
+        for song, columns in entries:
+            if columns is None:
+                columns = self.notes(song)
+            else:
+                columns = dict(columns, song=np.full(len(columns['start']), song['id'], dtype=COLUMNS['song']))
+            count = len(columns['start'])
+            for name in COLUMNS:
+                parts[name].append(columns[name])
+            songs.append(dict(song, offset=offset, count=count))
+            offset += count
+        for name, dtype in COLUMNS.items():
+            column = np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype=dtype)
+            np.save(self.__column(name, generation), column.astype(dtype, copy=False))
+        tmp = self.path / (self.SONGS_FILENAME + '.tmp')
+        with open(tmp, 'w') as writer:
+            json.dump({'format': self.STORE_FORMAT, 'generation': generation, 'dmx': dmx, 'songs': songs}, writer, separators=(',', ':'))
+        os.replace(tmp, self.path / self.SONGS_FILENAME)
+        # open memory maps of the old generation stay valid after the files are removed
+        for name in COLUMNS:
+            try:
+                os.unlink(self.__column(name))
+            except FileNotFoundError:
+                pass
+        self.generation = generation
+        self.dmx = dmx
+        self.songs = songs
+        self.columns = {name: np.load(self.__column(name), mmap_mode='r') for name in COLUMNS}
+
+def _readNotesSafely(path):
+    try:
+        return readNotes(path)
+    except (OSError, ValueError, IndexError, OverflowError) as e:
+        print_error('{}: {}'.format(path, e))
+        return None
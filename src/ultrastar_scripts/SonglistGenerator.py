@@ -1,11 +1,24 @@
 import sys
-import csv
-import json
+import os
 from pathlib import Path
+from contextlib import contextmanager
 from enum import IntFlag
-import yaml
+from functools import partial
 from itertools import chain
 
+from time import perf_counter
+
+from ultrastar_scripts.libultrastar import Stats, findSongFiles, phase, readHeader
+
+# yaml, csv, json, sqlite3, multiprocessing and asyncio are imported by the functions that use
+# them, so a run without DMX config or index does not pay for loading them
+
+# the tags _loadSong needs, everything else in the header is skipped
+SONG_TAGS = ('ARTIST', 'TITLE', 'LANGUAGE', 'YEAR')
+
+# bump this when the layout of writeSnapshot changes
+SNAPSHOT_FORMAT = 1
+
 class SongType(IntFlag):
     # base values
     LOSSY = 0
@@ -19,6 +32,19 @@ class SongType(IntFlag):
     LOSSLESS_INSTRUMENTAL_DUET = LOSSLESS | INSTRUMENTAL | DUET
 
 
+# column order of the variants in writeCsv
+CSV_VARIANTS = (
+    SongType.LOSSY,
+    SongType.INSTRUMENTAL,
+    SongType.DUET,
+    SongType.INSTRUMENTAL_DUET,
+    SongType.LOSSLESS,
+    SongType.LOSSLESS_INSTRUMENTAL,
+    SongType.LOSSLESS_DUET,
+    SongType.LOSSLESS_INSTRUMENTAL_DUET
+)
+
+
 class SonglistEntry:
     def __init__(self, artist: str, title: str, language: str, year: int, songtype: SongType, dmx: int):
         self.artist = artist
@@ -26,6 +52,8 @@ class SonglistEntry:
         self.language = language
         self.year = year
         self.variants = [songtype]
+        # bit n is set if a variant with SongType n exists, cheaper to test than the list
+        self.variantmask = 1 << songtype
         self.dmx = dmx
 
     def __iter__(self):
@@ -38,35 +66,243 @@ class SonglistEntry:
 
     def addVariant(self, songtype: SongType):
         self.variants.append(songtype)
+        self.variantmask |= 1 << songtype
+
+    def hasVariant(self, songtype: SongType) -> bool:
+        return bool(self.variantmask & (1 << songtype))
+
+
+# Prefix index over the DMX config. The first level is a trie on the lowercased artist, every
+# node where a config artist ends holds a second trie on the lowercased title. A lookup only
+# walks the characters of the song's artist and title instead of every config entry.
+class DmxIndex:
+    # key in a trie node for the payload, so it never clashes with a character
+    _VALUE = None
+
+    # sameas is the result of an earlier index over the same config, see DmxCache
+    def __init__(self, config: [dict], sameas: dict = None):
+        self.__config = config
+        self.__artists = {}
+        for position, c in enumerate(config):
+            titles = self.__insert(self.__artists, c['artist'].lower(), dict)
+            # for identical prefixes the first entry wins, same as max() over the list would
+            self.__insert(titles, c['title'].lower(), lambda: position)
+        self.warnings = []
+        if sameas is not None:
+            self.__sameas = sameas
+            return
+        # every same-as chain is followed once, here
+        self.__sameas = {}
+        for position, c in enumerate(config):
+            if c['same-as'] is not None:
+                self.__sameas[position] = self.__resolve(position)
+
+    # position of every same-as entry -> position it resolves to, or None
+    @property
+    def sameas(self) -> dict:
+        return dict(self.__sameas)
+
+    @classmethod
+    def __insert(cls, node: dict, key: str, factory):
+        for char in key:
+            node = node.setdefault(char, {})
+        if cls._VALUE not in node:
+            node[cls._VALUE] = factory()
+        return node[cls._VALUE]
+
+    # position of the longest matching config entry, ignoring same-as
+    def __find(self, artist: str, title: str):
+        best = None
+        bestLength = -1
+        l_title = title.lower()
+        node = self.__artists
+        for char in chain(artist.lower(), [None]):
+            titles = node.get(self._VALUE)
+            if titles is not None:
+                tnode = titles
+                for tchar in chain(l_title, [None]):
+                    position = tnode.get(self._VALUE)
+                    if position is not None:
+                        c = self.__config[position]
+                        length = len(c['artist'] + c['title'])
+                        if length > bestLength or (length == bestLength and position < best):
+                            best = position
+                            bestLength = length
+                    if tchar is None:
+                        break
+                    tnode = tnode.get(tchar)
+                    if tnode is None:
+                        break
+            if char is None:
+                break
+            node = node.get(char)
+            if node is None:
+                break
+        return best
+
+    def __resolve(self, position: int):
+        seen = [position]
+        while True:
+            c = self.__config[position]
+            artist = c['same-as'].get('artist', c['artist'])
+            title = c['same-as'].get('title', c['title'])
+            position = self.__find(artist, title)
+            if position is None:
+                return None
+            if self.__config[position]['same-as'] is None:
+                return position
+            if position in seen:
+                # a loop used to recurse forever, now it simply does not match
+                loop = ' -> '.join(self.__describe(p) for p in seen + [position])
+                warning = 'same-as loop in DMX config, ignoring: ' + loop + '\n'
+                self.warnings.append(warning)
+                sys.stderr.write(warning)
+                return None
+            seen.append(position)
+
+    def __describe(self, position: int) -> str:
+        c = self.__config[position]
+        return '{} - {} ({})'.format(c['artist'], c['title'], c['path'])
+
+    # will return the config obj for the best match, or None if nothing matches
+    def match(self, artist: str, title: str):
+        position = self.__find(artist, title)
+        if position is None:
+            return None
+        if position in self.__sameas:
+            position = self.__sameas[position]
+            if position is None:
+                return None
+        return self.__config[position]
 
 
 class SonglistGenerator:
-    __songlist = {}
-    
-    def __init__(self, paths: [str], dmxpaths: [str] = []):
+    def __init__(self, paths: [str], dmxpaths: [str] = None, index: str = None, ignore: [str] = None, stats: Stats = None,
+                 dmxcache: str = None, dmxjobs: int = 1):
         self.__paths = paths
-        self.__dmxpaths = dmxpaths
-        self._dmxconfig = self._loadDmxConfig()
+        # fnmatch patterns of directory names to skip
+        self.__ignore = ignore or []
+        self.__dmxpaths = dmxpaths or []
+        # optional DmxCache file, and the number of processes that parse the YAML files
+        self.__dmxcache = dmxcache
+        self.__dmxjobs = dmxjobs
+        self.__songlist = {}
+        # optional SonglistIndex file, so unchanged files are not read again
+        self.__indexpath = index
+        self.__index = None
+        # identifiers of the songlist that can differ from the previous run with the same index,
+        # None if that is not known, and the index generation before and after this run
+        self.__touched = None
+        self.__generations = (None, None)
+        # optional Stats, the phases of loading and generating are timed into it
+        self.__stats = stats
+        self._loadDmx()
     
+    # every call starts from an empty songlist, so a generator can be reused
     def generate(self):
-        for path in self.__paths:
-            for p in Path(path).glob('**/*.txt'):
-                song = self._loadSong(p)
-                if song:
-                    identifier = song.identifier()
-                    if identifier in self.__songlist:
-                        if self.__songlist[identifier].language != song.language:
-                            sys.stderr.write(str(p) + ' uses different language\n')
-                        self.__songlist[identifier].addVariant(song.songtype)
-                    else:
-                        self.__songlist[identifier] = SonglistEntry(song.artist, song.title, song.language, song.year, song.songtype, song.dmx)
+        with self.__indexed():
+            self._generate()
+
+    # Same result as generate(), for libraries on network shares where every open and stat
+    # waits for a round trip: up to concurrency files are read at the same time, in threads.
+    async def generate_async(self, concurrency: int = 16):
+        with self.__indexed():
+            await self._generateAsync(concurrency)
+
+    @contextmanager
+    def __indexed(self):
+        self.reset()
+        if self.__indexpath is not None:
+            from ultrastar_scripts.SonglistIndex import SonglistIndex
+            with phase(self.__stats, 'index'):
+                self.__index = SonglistIndex(self.__indexpath)
+            self.__touched = set()
+        try:
+            yield
+            if self.__index is not None:
+                with phase(self.__stats, 'index'):
+                    # the songs of changed and removed files, as they were before
+                    for artist, title, language, year in self.__index.stale():
+                        if artist is not None:
+                            self.__touched.add(self._Song(artist, title, language, year, 0).identifier())
+                    before = self.__index.generation
+                    self.__index.commit()
+                    self.__generations = (before, self.__index.generation)
+        finally:
+            if self.__index is not None:
+                self.__index.close()
+                self.__index = None
+
+    def reset(self):
+        self.__songlist = {}
+        self.__touched = None
+        self.__generations = (None, None)
+
+    def _generate(self):
+        # files are read as soon as they are found, but merged in a fixed order
+        paths = findSongFiles(self.__paths, self.__ignore)
+        if self.__stats is not None:
+            paths = self.__stats.iterate('walk', paths)
+        songs = [(p, self._loadSong(p)) for p in paths]
+        with phase(self.__stats, 'merge'):
+            self._merge(songs)
+
+    async def _generateAsync(self, concurrency: int):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        stats = self.__stats
+        lookup = partial(self._lookupSongMeasured, measured=stats is not None)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        # the walk runs in a thread of its own and hands every file to the pool as soon as it
+        # is found, the event loop stays free to collect the results
+        def submit():
+            paths = findSongFiles(self.__paths, self.__ignore)
+            if stats is not None:
+                paths = stats.iterate('walk', paths)
+            return [(p, executor.submit(lookup, p)) for p in paths]
+        try:
+            futures = await asyncio.to_thread(submit)
+            songs = []
+            # the index, the DMX matching and the stats are only touched here, in the event loop
+            for p, future in futures:
+                (tags, stat, read), phases, seconds = await asyncio.wrap_future(future)
+                start = perf_counter()
+                songs.append((p, self.__song(p, tags, stat, read)))
+                if stats is not None:
+                    # summed over the threads, so they can add up to more than the wall time
+                    for name, (wall, cpu) in phases.items():
+                        stats.add(name, wall, cpu)
+                    stats.addFile(p, seconds + perf_counter() - start)
+        finally:
+            # after an error, files that were not read yet are dropped
+            executor.shutdown(cancel_futures=True)
+        with phase(stats, 'merge'):
+            self._merge(songs)
+
+    def _merge(self, songs):
+        songs.sort(key=lambda s: s[0])
+        for p, song in songs:
+            if song:
+                identifier = song.identifier()
+                if identifier in self.__songlist:
+                    if self.__songlist[identifier].language != song.language:
+                        sys.stderr.write(str(p) + ' uses different language\n')
+                    self.__songlist[identifier].addVariant(song.songtype)
                 else:
-                    sys.stderr.write(str(p) + ' does not look like a song file, skipping\n')
+                    self.__songlist[identifier] = SonglistEntry(song.artist, song.title, song.language, song.year, song.songtype, song.dmx)
+            else:
+                sys.stderr.write(str(p) + ' does not look like a song file, skipping\n')
 
     def getSonglist(self):
-        return [entry for identifier, entry in sorted(self.__songlist.items())]
+        return list(self._sortedEntries())
+
+    def _sortedEntries(self):
+        songlist = self.__songlist
+        for identifier in sorted(songlist):
+            yield songlist[identifier]
 
     def writeCsv(self, output):
+        import csv
         writer = csv.writer(output)
         writer.writerow([
             'Artist',
@@ -81,36 +317,171 @@ class SonglistGenerator:
             'Lossless Duet',
             'Lossless Duet Instrumental'
         ])
-        for identifier, entry in sorted(self.__songlist.items()):
-            writer.writerow([
-                entry.artist,
-                entry.title,
-                entry.language,
-                int(SongType.LOSSY in entry.variants),
-                int(SongType.INSTRUMENTAL in entry.variants),
-                int(SongType.DUET in entry.variants),
-                int(SongType.INSTRUMENTAL_DUET in entry.variants),
-                int(SongType.LOSSLESS in entry.variants),
-                int(SongType.LOSSLESS_INSTRUMENTAL in entry.variants),
-                int(SongType.LOSSLESS_DUET in entry.variants),
-                int(SongType.LOSSLESS_INSTRUMENTAL_DUET in entry.variants)
-            ])
+        writer.writerows(
+            [entry.artist, entry.title, entry.language] + [(entry.variantmask >> songtype) & 1 for songtype in CSV_VARIANTS]
+            for entry in self._sortedEntries()
+        )
 
+    # same output as json.dump(..., indent=4), but written one entry at a time
     def writeJson(self, output):
-        json.dump({'songlist': list(map(dict, self.getSonglist()))}, output, indent=4)
+        import json
+        output.write('{\n    "songlist": [')
+        separator = '\n        '
+        for entry in self._sortedEntries():
+            output.write(separator)
+            output.write(json.dumps(dict(entry), indent=4).replace('\n', '\n        '))
+            separator = ',\n        '
+        if separator != '\n        ':
+            output.write('\n    ')
+        output.write(']\n}')
+
+    # JSON Lines: one compact object per entry
+    def writeJsonLines(self, output):
+        import json
+        encoder = json.JSONEncoder(separators=(',', ':'))
+        for entry in self._sortedEntries():
+            output.write(encoder.encode(dict(entry)))
+            output.write('\n')
+
+    # The songlist keyed by identifier, with what it was generated from, for delta() on the
+    # next run. Written to a temporary file first, so an interrupted run keeps the old one.
+    def writeSnapshot(self, path: str):
+        import json
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as writer:
+            json.dump({
+                'format': SNAPSHOT_FORMAT,
+                'state': self.__state(self.__generations[1]),
+                'songlist': {identifier: dict(entry) for identifier, entry in self.__songlist.items()}
+            }, writer, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    # returns the snapshot in path, or None if there is none or it cannot be used
+    @staticmethod
+    def readSnapshot(path: str):
+        import json
+        try:
+            with open(path) as reader:
+                snapshot = json.load(reader)
+            if snapshot['format'] == SNAPSHOT_FORMAT and isinstance(snapshot['songlist'], dict):
+                return snapshot
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    # everything besides the txt files that the songlist depends on; the index generation
+    # tells whether another run used the index in between
+    def __state(self, generation: int) -> dict:
+        from ultrastar_scripts.DmxCache import DmxCache
+        return {
+            'paths': sorted(os.path.abspath(path) for path in self.__paths),
+            'ignore': sorted(self.__ignore),
+            'dmx': DmxCache.key(self._dmxFiles()),
+            'index': self.__indexpath and os.path.abspath(self.__indexpath),
+            'generation': generation
+        }
+
+    # Returns the songs that were added, removed and changed since snapshot (None for an empty
+    # one). Entries are matched by identifier, like in the songlist; removed ones only have
+    # artist and title, changed ones artist and title plus the fields that changed. If the
+    # snapshot was written by the previous run with the same index, only the songs of the
+    # files that were read again are compared, otherwise every song.
+    def delta(self, snapshot: dict = None) -> dict:
+        current = self.__songlist
+        previous = snapshot['songlist'] if snapshot is not None else {}
+        if (snapshot is not None and self.__touched is not None
+                and snapshot.get('state') == self.__state(self.__generations[0])):
+            identifiers = self.__touched
+        else:
+            identifiers = current.keys() | previous.keys()
+        added = []
+        removed = []
+        changed = []
+        for identifier in sorted(identifiers):
+            entry = current.get(identifier)
+            old = previous.get(identifier)
+            if entry is None:
+                if old is not None:
+                    removed.append({'artist': old['artist'], 'title': old['title']})
+                continue
+            new = dict(entry)
+            if old is None:
+                added.append(new)
+                continue
+            fields = {key: value for key, value in new.items() if old.get(key) != value}
+            if fields:
+                changed.append(dict({'artist': new['artist'], 'title': new['title']}, **fields))
+        return {'added': added, 'removed': removed, 'changed': changed}
+
+    @staticmethod
+    def writeDelta(delta: dict, output):
+        import json
+        json.dump(delta, output, indent=4)
+
+    # JSON Lines: one compact object per song, with "change" set to added, removed or changed
+    @staticmethod
+    def writeDeltaLines(delta: dict, output):
+        import json
+        encoder = json.JSONEncoder(separators=(',', ':'))
+        for change in ('added', 'removed', 'changed'):
+            for entry in delta[change]:
+                output.write(encoder.encode(dict({'change': change}, **entry)))
+                output.write('\n')
 
     ### DMX/YAML FUNCTIONS START ###
-    def _loadDmxConfig(self):
-        res = []
-        for path in self.__dmxpaths:
-            dmxs = list(map(lambda p: self._loadDmxFile(p), Path(path).rglob('*.yml')))
-            res += list(chain.from_iterable(dmxs))
-        return res
-
-    def _loadDmxFile(self, path):
+    def _dmxFiles(self) -> [Path]:
+        return [p for path in self.__dmxpaths for p in Path(path).rglob('*.yml')]
+
+    # sets _dmxconfig and _dmxindex, with only the changed files loaded again if there is a DmxCache
+    def _loadDmx(self):
+        stats = self.__stats
+        sameas = None
+        with phase(stats, 'dmx-config'):
+            files = self._dmxFiles()
+            if self.__dmxcache is None:
+                self._dmxconfig = self._loadDmxConfig(files)
+            else:
+                from ultrastar_scripts.DmxCache import DmxCache
+                cache = DmxCache(self.__dmxcache)
+                key = cache.key(files)
+                entries = [cache.get(*k) for k in key]
+                missing = [p for p, e in zip(files, entries) if e is None]
+                loaded = iter(self._loadDmxFiles(missing))
+                entries = [next(loaded) if e is None else e for e in entries]
+                self._dmxconfig = list(chain.from_iterable(entries))
+                resolved = cache.resolved(key)
+                if resolved is not None:
+                    sameas, warnings = resolved
+                    for warning in warnings:
+                        sys.stderr.write(warning)
+        with phase(stats, 'dmx-index'):
+            self._dmxindex = DmxIndex(self._dmxconfig, sameas)
+        if self.__dmxcache is not None and sameas is None:
+            with phase(stats, 'dmx-config'):
+                cache.save(key, entries, self._dmxindex.sameas, self._dmxindex.warnings)
+
+    def _loadDmxConfig(self, files: [Path] = None):
+        if files is None:
+            files = self._dmxFiles()
+        return list(chain.from_iterable(self._loadDmxFiles(files)))
+
+    # the entries of every file, in order
+    def _loadDmxFiles(self, files: [Path]) -> [[dict]]:
+        # YAML parsing is CPU bound, so files are spread over processes; map keeps the order
+        if self.__dmxjobs > 1 and len(files) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.__dmxjobs) as executor:
+                return list(executor.map(self._loadDmxFile, files))
+        return list(map(self._loadDmxFile, files))
+
+    @staticmethod
+    def _loadDmxFile(path):
+        import yaml
+        # the C loader is many times faster, but only there if PyYAML was built with libyaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         with open(path, 'r') as p:
             res = []
-            for document in yaml.safe_load_all(p):
+            for document in yaml.load_all(p, Loader=loader):
                 for c in document['songs']:
                     dmxcount = 1 + len(c.get('instructions', []))
                     res.append({'artist': c['artist'], 'title': c['title'], 'same-as': c.get('same-as'), 'dmx': dmxcount, 'path': p.name})
@@ -118,21 +489,7 @@ class SonglistGenerator:
 
     # will return the config obj for the best match, or None if nothing matches
     def _bestDmxConfigMatch(self, artist: str, title: str):
-        l_artist = artist.lower()
-        l_title = title.lower()
-        candidates = list(filter(
-            lambda o: l_artist.startswith(o['artist'].lower()) and l_title.startswith(o['title'].lower()),
-            self._dmxconfig
-        ))
-        if len(candidates) < 1:
-            return None
-        song = max(candidates, key=lambda c: len(c['artist']+c['title']))
-        if song['same-as'] is not None:
-            artist = song['same-as'].get('artist', song['artist'])
-            title = song['same-as'].get('title', song['title'])
-            # WARNING: there is no infinite recursion safeguarding
-            song = self._bestDmxConfigMatch(artist, title)
-        return song
+        return self._dmxindex.match(artist, title)
     
     def _dmxCount(self, artist: str, title: str):
         match = self._bestDmxConfigMatch(artist, title)
@@ -142,46 +499,82 @@ class SonglistGenerator:
     ### DMX/YAML FUNCTIONS END ###
 
     def _loadSong(self, path: str):
-        artist = None
-        title = None
-        language = None
+        if self.__stats is None:
+            return self.__loadSong(path)
+        start = perf_counter()
+        try:
+            return self.__loadSong(path)
+        finally:
+            self.__stats.addFile(path, perf_counter() - start)
+
+    def __loadSong(self, path: str):
+        return self.__song(path, *self._lookupSong(path, self.__stats))
+
+    # Returns (tags, stat, read): the tags from the index or the file, the stat the index
+    # compared (None without index) and whether the file was read. This is the part that
+    # waits for the disk, it is safe to call from several threads: it only reads from the
+    # index, what was seen is recorded by __song.
+    def _lookupSong(self, path: str, stats: Stats = None) -> (tuple, os.stat_result, bool):
+        if self.__index is None:
+            with phase(stats, 'read'):
+                return self._readSongTags(path), None, True
+        with phase(stats, 'index'):
+            stat = os.stat(path)
+            tags = self.__index.get(path, stat)
+        if tags is not None:
+            return tags, stat, False
+        with phase(stats, 'read'):
+            return self._readSongTags(path), stat, True
+
+    # _lookupSong in a worker thread: the phases are timed here and added up by the caller,
+    # and the seconds for the file are returned as well
+    def _lookupSongMeasured(self, path: str, measured: bool = False) -> (tuple, dict, float):
+        filestats = Stats() if measured else None
+        start = perf_counter()
+        result = self._lookupSong(path, filestats)
+        return result, filestats and filestats.phases, perf_counter() - start
+
+    def __song(self, path: str, tags: tuple, stat: os.stat_result, read: bool):
+        stats = self.__stats
+        if self.__index is not None:
+            with phase(stats, 'index'):
+                if read:
+                    self.__index.put(path, stat, tags)
+                else:
+                    self.__index.seen(path)
+        artist, title, language, year = tags
+        if artist is None:
+            # this most likely was not a song file, just ignore it
+            return None
+        with phase(stats, 'dmx-match'):
+            dmx = self._dmxCount(artist, title)
+        song = self._Song(artist, title, language, year, dmx)
+        if read and self.__touched is not None:
+            self.__touched.add(song.identifier())
+        return song
+
+    # returns (artist, title, language, year), all None if it does not look like a song file
+    def _readSongTags(self, path: str) -> tuple:
+        # the encoding is detected per file, so a CP1252 file does not stop the whole list
+        tags = readHeader(path, SONG_TAGS)
+        artist = tags.get('ARTIST')
+        title = tags.get('TITLE')
+        language = tags.get('LANGUAGE')
         year = None
-        with open(path) as reader:
+        if 'YEAR' in tags:
             try:
-                for line in reader:
-                    # remove BOM
-                    if line.startswith('\ufeff'):
-                        line = line[1:]
-                    if line.startswith('#ARTIST:'):
-                        artist = line.strip().replace('#ARTIST:', '', 1)
-                    elif line.startswith('#TITLE:'):
-                        title = line.strip().replace('#TITLE:', '', 1)
-                    elif line.startswith('#LANGUAGE:'):
-                        language = line.strip().replace('#LANGUAGE:', '', 1)
-                    elif line.startswith('#YEAR:'):
-                        try:
-                            year = int(line.strip().replace('#YEAR:', '', 1))
-                        except ValueError:
-                            raise Exception(str(path) + ' cannot parse #YEAR')
-                    elif line.startswith('#'):
-                        # do nothing as we're still processing tags
-                        pass
-                    else:
-                        # we've parsed all the tags
-                        if artist is None and title is None and language is None:
-                            # this most likely was not a song file, just ignore it
-                            return None
-                        elif artist is not None and title is not None and language is not None:
-                            dmx = self._dmxCount(artist, title)
-                            return self._Song(artist, title, language, year, dmx)
-                        elif artist is None:
-                            raise Exception(str(path) + ' does not set #ARTIST')
-                        elif title is None:
-                            raise Exception(str(path) + ' does not set #TITLE')
-                        elif language is None:
-                            raise Exception(str(path) + ' does not set #LANGUAGE')
-            except UnicodeDecodeError as ude:
-                raise Exception('error while loading ' + str(path)) from ude
+                year = int(tags['YEAR'])
+            except ValueError:
+                raise Exception(str(path) + ' cannot parse #YEAR')
+        if artist is None and title is None and language is None:
+            return None, None, None, None
+        elif artist is None:
+            raise Exception(str(path) + ' does not set #ARTIST')
+        elif title is None:
+            raise Exception(str(path) + ' does not set #TITLE')
+        elif language is None:
+            raise Exception(str(path) + ' does not set #LANGUAGE')
+        return artist, title, language, year
 
     class _Song:
         def __init__(self, artist: str, title: str, language: str, year: int, dmx: int):
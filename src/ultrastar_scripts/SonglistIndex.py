@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+# Persistent index of the song tags SonglistGenerator needs, per txt file.
+# A file is only read again when its mtime or size changed.
+class SonglistIndex:
+    # bump this when the table layout or the meaning of a column changes
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path: str):
+        self.__db = sqlite3.connect(str(path))
+        if self.__db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            self.__db.execute('DROP TABLE IF EXISTS songs')
+            self.__db.execute('DROP TABLE IF EXISTS meta')
+            self.__db.execute('PRAGMA user_version = {}'.format(self.SCHEMA_VERSION))
+        self.__db.execute('''
+            CREATE TABLE IF NOT EXISTS songs (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                artist TEXT,
+                title TEXT,
+                language TEXT,
+                year INTEGER
+            )
+        ''')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        # goes up with every commit, so a songlist snapshot can tell whether it was made from
+        # exactly this state of the index
+        row = self.__db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self.generation = row[0] if row else 0
+        # loading every row at once is much cheaper than one query per file
+        self.__rows = {
+            row[0]: row[1:]
+            for row in self.__db.execute('SELECT path, mtime, size, artist, title, language, year FROM songs')
+        }
+        self.__seen = set()
+        self.__changed = []
+        # files whose stored row is replaced by put()
+        self.__replaced = set()
+
+    @staticmethod
+    def key(path) -> str:
+        return os.path.abspath(path)
+
+    # Returns the stored (artist, title, language, year) or None if the file has to be read
+    # again. It only reads the rows loaded when the index was opened, so worker threads can
+    # call it; the file still has to be passed to seen() or put().
+    def get(self, path, stat: os.stat_result):
+        row = self.__rows.get(self.key(path))
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            return None
+        return row[2:]
+
+    # keeps the stored row of a file that was not read again
+    def seen(self, path):
+        self.__seen.add(self.key(path))
+
+    def put(self, path, stat: os.stat_result, tags: tuple):
+        key = self.key(path)
+        self.__seen.add(key)
+        if key in self.__rows:
+            self.__replaced.add(key)
+        self.__changed.append((key, stat.st_mtime_ns, stat.st_size) + tuple(tags))
+
+    # the stored (artist, title, language, year) of the files that changed or were not seen
+    # since the index was opened, that is what the songlist contained before
+    def stale(self) -> [tuple]:
+        return [row[2:] for key, row in self.__rows.items() if key in self.__replaced or key not in self.__seen]
+
+    # writes the changes and forgets every file that was not seen since the index was opened
+    def commit(self):
+        self.__db.executemany('INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?)', self.__changed)
+        self.__db.executemany('DELETE FROM songs WHERE path = ?', [(key,) for key in self.__rows.keys() - self.__seen])
+        self.generation += 1
+        self.__db.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (self.generation,))
+        self.__db.commit()
+        self.__changed = []
+
+    def close(self):
+        self.__db.close()
@@ -0,0 +1,232 @@
+import os
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from functools import reduce
+from operator import and_, or_
+
+from ultrastar_scripts.SonglistGenerator import SonglistEntry, SongType
+
+# base64 and json are imported by save() and load(), searching does not need them
+
+# In-memory search over a generated songlist, for search-as-you-type. Artist and title are
+# split into words after case and accent folding, so "beyonce" finds "Beyoncé" and "AC/DC"
+# is found by "ac" and by "dc". Every word of a query has to be the start of a word of the
+# artist or title of a song.
+#
+# The index is one array of song positions: the positions of every song with a word, word
+# after word in sorted order, so all words that start with a prefix are one slice of it.
+# Words and filters that match many songs are bitsets, which intersect in a few microseconds.
+# Results are in songlist order, that is sorted by identifier like getSonglist().
+
+WORD = re.compile(r'\w+')
+
+# words and filters that match at least 1 in DENSE songs are kept as bitsets
+DENSE = 64
+
+# bytes of a bitset that are counted at once when looking for a page
+CHUNK = 64
+
+# case and accent folding: casefold, then split accented characters into the base character
+# and combining marks and drop the marks
+def fold(text: str) -> str:
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+def words(text: str) -> [str]:
+    return WORD.findall(fold(text))
+
+# int.bit_count() is new in Python 3.10
+_bitCount = getattr(int, 'bit_count', lambda bits: bin(bits).count('1'))
+
+def _packed(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _unpacked(data: bytes) -> array:
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+class SonglistSearch:
+    # bump this when the layout of the saved file changes
+    SEARCH_FORMAT = 1
+
+    # songs are [artist, title, language, year, variants, dmx] in songlist order; words,
+    # offsets and positions are the index as saved, built from the songs if not given
+    def __init__(self, songs: [list], words: [str] = None, offsets: array = None, positions: array = None):
+        self.songs = songs
+        if words is None:
+            words, offsets, positions = self.__build(songs)
+        self.__words = words
+        # the positions of the songs with words[n] are positions[offsets[n]:offsets[n + 1]]
+        self.__offsets = offsets
+        self.__positions = positions
+        # size of a bitset
+        self.__bytes = (len(songs) + 7) // 8
+        # (word, prefix) -> bitset of __matches
+        self.__dense = {}
+        # built on the first query that filters
+        self.__languages = None
+        self.__variants = None
+        self.__years = None
+
+    @classmethod
+    def fromSonglist(cls, songlist: [SonglistEntry]):
+        return cls([[entry.artist, entry.title, entry.language, entry.year, [int(songtype) for songtype in entry.variants], entry.dmx]
+                    for entry in songlist])
+
+    @staticmethod
+    def __build(songs: [list]) -> ([str], array, array):
+        index = {}
+        for position, song in enumerate(songs):
+            for word in set(words(song[0] + ' ' + song[1])):
+                index.setdefault(word, array('I')).append(position)
+        sortedWords = sorted(index)
+        offsets = array('I', [0])
+        positions = array('I')
+        for word in sortedWords:
+            positions.extend(index[word])
+            offsets.append(len(positions))
+        return sortedWords, offsets, positions
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    # written to a temporary file first, so a service starting meanwhile reads the old one
+    def save(self, path: str):
+        import base64
+        import json
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as writer:
+            json.dump({
+                'format': self.SEARCH_FORMAT,
+                'songs': self.songs,
+                'words': self.__words,
+                # little-endian uint32, base64 keeps them a few times smaller than JSON numbers
+                'offsets': base64.b64encode(_packed(self.__offsets)).decode('ascii'),
+                'positions': base64.b64encode(_packed(self.__positions)).decode('ascii')
+            }, writer, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    # nothing is folded or sorted again, loading is decoding the file
+    @classmethod
+    def load(cls, path: str):
+        import base64
+        import json
+        with open(path, encoding='utf-8') as reader:
+            data = json.load(reader)
+        if data.get('format') != cls.SEARCH_FORMAT:
+            raise ValueError('{} is not a songlist search index of format {}'.format(path, cls.SEARCH_FORMAT))
+        return cls(data['songs'], data['words'],
+                   _unpacked(base64.b64decode(data['offsets'])), _unpacked(base64.b64decode(data['positions'])))
+
+    def entry(self, position: int) -> SonglistEntry:
+        artist, title, language, year, variants, dmx = self.songs[position]
+        entry = SonglistEntry(artist, title, language, year, SongType(variants[0]), dmx)
+        for songtype in variants[1:]:
+            entry.addVariant(SongType(songtype))
+        return entry
+
+    # Returns the number of matching songs and the entries of the requested page. query is
+    # matched against artist and title, with prefix=False only whole words match. language
+    # is compared after folding, years is an inclusive (first, last) range and variant a
+    # SongType the song has to exist as.
+    def search(self, query: str = '', language: str = None, years: (int, int) = None, variant: SongType = None,
+               offset: int = 0, limit: int = 20, prefix: bool = True) -> (int, [SonglistEntry]):
+        matches = [self.__matches(word, prefix) for word in words(query)]
+        if language is not None or years is not None or variant is not None:
+            self.__buildFilters()
+            if language is not None:
+                matches.append(self.__languages.get(fold(language), 0))
+            if years is not None:
+                first, last = years
+                matches.append(reduce(or_, (bits for year, bits in self.__years.items() if first <= year <= last), 0))
+            if variant is not None:
+                matches.append(self.__variants.get(int(variant), 0))
+        if not matches:
+            return len(self.songs), [self.entry(position) for position in range(offset, min(offset + limit, len(self.songs)))]
+        sparse = [m for m in matches if not isinstance(m, int)]
+        dense = [m for m in matches if isinstance(m, int)]
+        if not sparse:
+            bits = reduce(and_, dense)
+            return _bitCount(bits), [self.entry(position) for position in self.__page(bits, offset, limit)]
+        # the smallest first, intersecting goes through the smaller set
+        sparse.sort(key=len)
+        found = sparse[0].intersection(*sparse[1:]) if len(sparse) > 1 else sparse[0]
+        if dense:
+            data = reduce(and_, dense).to_bytes(self.__bytes, 'little')
+            found = [position for position in found if data[position >> 3] >> (position & 7) & 1]
+        return len(found), [self.entry(position) for position in sorted(found)[offset:offset + limit]]
+
+    # The songs with a word that is word, or starts with it: a frozenset if there are few of
+    # them, otherwise a bitset as an int, with bit n set for the song at position n. Bitsets
+    # are kept once computed, there can only be a few for every length of word.
+    def __matches(self, word: str, prefix: bool):
+        cached = self.__dense.get((word, prefix))
+        if cached is not None:
+            return cached
+        words = self.__words
+        first = bisect_left(words, word)
+        if prefix:
+            # every word that starts with word sorts before word followed by the last character
+            last = bisect_left(words, word + '\U0010ffff', first)
+        else:
+            last = first + 1 if first < len(words) and words[first] == word else first
+        positions = self.__positions[self.__offsets[first]:self.__offsets[last]]
+        if len(positions) * DENSE < len(self.songs):
+            return frozenset(positions)
+        bits = self.__dense[word, prefix] = self.__bits(positions)
+        return bits
+
+    def __bits(self, positions) -> int:
+        data = bytearray(self.__bytes)
+        for position in positions:
+            data[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(data, 'little')
+
+    # the filters are bitsets for every language, variant and year
+    def __buildFilters(self):
+        if self.__languages is not None:
+            return
+        languages = {}
+        variants = {}
+        years = {}
+        for position, (artist, title, language, year, songtypes, dmx) in enumerate(self.songs):
+            languages.setdefault(fold(language), []).append(position)
+            for songtype in songtypes:
+                variants.setdefault(songtype, []).append(position)
+            if year is not None:
+                years.setdefault(year, []).append(position)
+        self.__languages = {language: self.__bits(positions) for language, positions in languages.items()}
+        self.__variants = {songtype: self.__bits(positions) for songtype, positions in variants.items()}
+        self.__years = {year: self.__bits(positions) for year, positions in years.items()}
+
+    # the positions of the set bits offset to offset + limit, counted a chunk at a time
+    def __page(self, bits: int, offset: int, limit: int) -> [int]:
+        data = bits.to_bytes(self.__bytes, 'little')
+        page = []
+        for start in range(0, len(data), CHUNK):
+            chunk = int.from_bytes(data[start:start + CHUNK], 'little')
+            count = _bitCount(chunk)
+            if offset >= count:
+                offset -= count
+                continue
+            while chunk and len(page) < limit:
+                lowest = chunk & -chunk
+                chunk ^= lowest
+                if offset:
+                    offset -= 1
+                else:
+                    page.append(start * 8 + lowest.bit_length() - 1)
+            if len(page) == limit:
+                break
+        return page
@@ -0,0 +1,43 @@
+import sys
+from importlib import import_module
+
+# One command for all scripts: `ultrastar check songs/`, `ultrastar fix-whitespace < a.txt`, ...
+# Only the module of the chosen subcommand is imported, so startup stays as short as that of
+# the separate ultrastar-* scripts. Also runs as `python -m ultrastar_scripts`.
+
+# subcommand: (module, description)
+COMMANDS = {
+    'check': ('check', 'Check Ultrastar txt files'),
+    'export-notes': ('export_notes', 'Export the notes of song directories into a columnar store'),
+    'fix-linebreaks': ('fix_linebreaks', 'Put linebreaks in sensible places'),
+    'fix-whitespace': ('fix_whitespace', 'Move spaces at the end of notes to the start of the next one'),
+    'multiply-bpm': ('multiply_bpm', 'Multiply the BPM of a txt file'),
+    'pipeline': ('pipeline', 'Run several transformations in one go'),
+    'split-lyrics': ('split_lyrics', 'Split notes that contain _ or + into separate notes'),
+    'songlist-csv': ('songlist_csv', 'Create a csv songlist from song directories'),
+    'songlist-json': ('songlist_json', 'Create a json songlist from song directories')
+}
+
+def _usage(output):
+    output.write('usage: ultrastar COMMAND [ARGUMENTS]\n\ncommands:\n')
+    for name, (module, description) in COMMANDS.items():
+        output.write('  {:<16}{}\n'.format(name, description))
+    output.write('\nRun ultrastar COMMAND --help for the arguments of a command.\n')
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        if len(sys.argv) >= 2 and sys.argv[1] in ('-h', '--help'):
+            _usage(sys.stdout)
+            return 0
+        if len(sys.argv) >= 2:
+            sys.stderr.write('ultrastar: unknown command ' + sys.argv[1] + '\n')
+        _usage(sys.stderr)
+        return 2
+    name = sys.argv[1]
+    module = import_module('ultrastar_scripts.' + COMMANDS[name][0])
+    # argparse takes the program name from argv[0], so usage and errors read "ultrastar check"
+    sys.argv = ['ultrastar ' + name] + sys.argv[2:]
+    return module.main()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import io
+import os
+from functools import partial
+from pathlib import Path
+
+from ultrastar_scripts.libultrastar import findSongFiles, print_error, readSong, tokenize
+
+# Batch mode for the scripts that transform a txt file: instead of one stdin/stdout stream per
+# process, rewrite many files in place. A transform is a picklable callable that takes the
+# events of a file and yields the events to write.
+# Every transform script imports this module, so what only batch mode needs is imported
+# when batch mode runs: a single stdin/stdout run starts faster without it.
+
+def addBatchArguments(parser: argparse.ArgumentParser):
+    parser.add_argument('-b', '--batch', nargs='+', metavar='PATH', help='Rewrite these files in place instead of using input/output; directories are searched for txt files and glob patterns are expanded')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files to rewrite in parallel in batch mode (default: 1)')
+    parser.add_argument('--dry-run', action='store_true', help='In batch mode, only show which files would change')
+
+def expandPaths(patterns: [str]) -> [Path]:
+    import glob
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(findSongFiles([pattern]))
+        elif os.path.exists(pattern):
+            paths.add(Path(pattern))
+        else:
+            for match in glob.glob(pattern, recursive=True):
+                if os.path.isdir(match):
+                    paths.update(findSongFiles([match]))
+                else:
+                    paths.add(Path(match))
+    return sorted(paths)
+
+def _countChanges(old: [str], new: [str]) -> (int, int):
+    import difflib
+    added = 0
+    removed = 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag != 'equal':
+            removed += i2 - i1
+            added += j2 - j1
+    return added, removed
+
+# rewrites a single file, returns (path, added lines, removed lines, error)
+def rewriteFile(path: Path, transform, dryRun: bool = False):
+    try:
+        text, encoding = readSong(path)
+        reader = io.StringIO(text, newline=None)
+        lines = reader.readlines()
+        # keep the line endings and the encoding of the original file
+        newline = reader.newlines if isinstance(reader.newlines, str) else None
+        new = [str(event) for event in transform(tokenize(lines))]
+        if new == lines:
+            return path, 0, 0, None
+        added, removed = _countChanges(lines, new)
+        if not dryRun:
+            import shutil
+            import tempfile
+            # write next to the original and rename, so the file is never half-written
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.' + path.name + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding=encoding, newline=newline) as writer:
+                    writer.writelines(new)
+                shutil.copymode(path, tmp)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return path, added, removed, None
+    except (OSError, ValueError, IndexError, UnicodeEncodeError) as e:
+        return path, 0, 0, str(e)
+
+# returns the exit code: 0 if every file could be processed, 1 otherwise
+def runBatch(patterns: [str], transform, jobs: int = 1, dryRun: bool = False) -> int:
+    paths = expandPaths(patterns)
+    rewrite = partial(rewriteFile, transform=transform, dryRun=dryRun)
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(rewrite, paths, chunksize=8))
+    else:
+        results = list(map(rewrite, paths))
+
+    changed = 0
+    failed = 0
+    for path, added, removed, error in results:
+        if error is not None:
+            print_error('{}: {}'.format(path, error))
+            failed += 1
+        elif added or removed:
+            print('{}: +{} -{}'.format(path, added, removed))
+            changed += 1
+    print('{} of {} files {}changed'.format(changed, len(paths), 'would be ' if dryRun else ''))
+    if failed:
+        print_error('{} files could not be processed'.format(failed))
+        return 1
+    return 0
@@ -0,0 +1,474 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import yaml
+
+from ultrastar_scripts.check import check
+from ultrastar_scripts.libultrastar import UTF8_BOM, Tag, readHeader, tokenize, writeEvents
+from ultrastar_scripts.pipeline import STAGES, compose, stage
+from ultrastar_scripts.SonglistGenerator import SONG_TAGS, SonglistEntry, SonglistGenerator, SongType
+from ultrastar_scripts.SonglistSearch import SonglistSearch
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is simply not reported there
+    resource = None
+
+# Run with: python -m ultrastar_scripts.benchmark
+#
+# Every benchmark runs in a fresh process so its peak RSS is its own. With --save the results
+# are appended to a JSON lines file together with the git commit, --compare shows the change
+# against the last run in such a file that used the same library.
+
+BENCHMARKS = ['headers', 'check', 'generate', 'network', 'search', 'transforms', 'soak', 'startup']
+
+# benchmarks that read every note, the others only read the header
+NOTE_BENCHMARKS = ('check', 'transforms')
+
+# an example argument for the stages that need one
+STAGE_ARGUMENTS = {'multiply-bpm': '2', 'split-lyrics': '_'}
+
+LANGUAGES = ['English', 'German', 'Dutch', 'Japanese', 'French']
+
+# words for the artists and titles of the search benchmark, accents included
+SEARCH_WORDS = ['love', 'night', 'heart', 'fire', 'Beyoncé', 'Motörhead', 'Björk', 'Ça', 'Straße', 'dance', 'queen',
+                'rhapsody', 'summer', 'dream', 'light', 'rain', 'élan', 'sigur', 'rós', 'the', 'of', 'my']
+
+# the kinds of queries of the search benchmark, see _searchQuery
+SEARCH_QUERIES = ['prefix', 'words', 'filtered', 'deep-page']
+
+# title suffixes that SonglistGenerator merges into variants of one songlist entry
+VARIANTS = ['(Lossless)', '(Instrumental)', '(Duet)', '(Lossless) (Duet)']
+
+def _notes(rng: random.Random, count: int, beat: int = 0) -> ([str], int):
+    lines = []
+    for i in range(count):
+        if i and i % 8 == 0:
+            lines.append('- {}\n'.format(beat + 2))
+            beat += 4
+        length = rng.randint(1, 8)
+        lines.append('{} {} {} {} {}\n'.format(rng.choice('::::::*F'), beat, length, rng.randint(-5, 15), 'la'))
+        beat += length + rng.randint(0, 4)
+    return lines, beat
+
+# writes a deterministic synthetic library, returns the list of txt files.
+# duets, boms and variants are the fractions of files with P1/P2 sections, with a UTF-8 BOM
+# and that are a (Lossless)/(Instrumental)/(Duet) variant of the song before them
+def generateLibrary(root: Path, songs: int = 1000, notes: int = 200, seed: int = 0,
+                    duets: float = 0.1, boms: float = 0.1, variants: float = 0.2) -> [Path]:
+    rng = random.Random(seed)
+    paths = []
+    base = 0
+    for n in range(songs):
+        suffix = ''
+        if n and rng.random() < variants:
+            suffix = ' ' + rng.choice(VARIANTS)
+        else:
+            # variants keep the language and year of their song, or they would not be merged
+            base = n
+            language = rng.choice(LANGUAGES)
+            year = rng.randint(1950, 2020)
+        duet = '(Duet)' in suffix or rng.random() < duets
+        directory = Path(root) / 'Artist {}'.format(base // 10) / 'Title {}{} {}'.format(base, suffix, n)
+        directory.mkdir(parents=True, exist_ok=True)
+        lines = [
+            '#ARTIST:Artist {}\n'.format(base // 10),
+            '#TITLE:Title {}{}\n'.format(base, suffix),
+            '#LANGUAGE:{}\n'.format(language),
+            '#YEAR:{}\n'.format(year),
+            '#GENRE:Pop\n',
+            '#MP3:song.mp3\n',
+            '#COVER:cover.jpg\n',
+            '#BPM:{}\n'.format(rng.choice(['200', '250,5', '300'])),
+            '#GAP:{}\n'.format(rng.randint(0, 20000))
+        ]
+        if duet:
+            # both players sing the same stretch of the song
+            first, end = _notes(rng, notes // 2)
+            second, end = _notes(rng, notes - notes // 2)
+            lines += ['P1\n'] + first + ['P2\n'] + second
+        else:
+            lines += _notes(rng, notes)[0]
+        lines.append('E\n')
+        if rng.random() < boms:
+            lines[0] = UTF8_BOM.decode('utf-8') + lines[0]
+        path = directory / 'song.txt'
+        path.write_text(''.join(lines), encoding='utf-8')
+        paths.append(path)
+    return paths
+
+# writes DMX config files for the songs in the library: every file holds entries songs, about
+# one in ten of them a same-as of an earlier entry, with instructions lines each
+def generateDmxConfig(root: Path, songs: int, files: int = 4, entries: int = 250, instructions: int = 20, seed: int = 0) -> [Path]:
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for f in range(files):
+        config = []
+        for i in range(entries):
+            n = rng.randrange(songs)
+            entry = {'artist': 'Artist {}'.format(n // 10), 'title': 'Title {}'.format(n)}
+            if config and rng.random() < 0.1:
+                other = rng.choice(config)
+                entry['same-as'] = {'artist': other['artist'], 'title': other['title']}
+            else:
+                entry['instructions'] = [
+                    {'time': rng.randint(0, 300000), 'channel': rng.randint(1, 16), 'value': rng.randint(0, 255)}
+                    for j in range(instructions)
+                ]
+            config.append(entry)
+        path = root / 'dmx{}.yml'.format(f)
+        with open(path, 'w') as writer:
+            yaml.safe_dump({'songs': config}, writer, sort_keys=False)
+        paths.append(path)
+    return paths
+
+def _timeit(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+# reading the header the way SonglistGenerator did before readHeader: text mode, tokenizing every line
+def _tokenizeHeaders(paths: [Path]):
+    for p in paths:
+        with open(p) as reader:
+            for event in tokenize(reader):
+                if not isinstance(event, Tag):
+                    break
+
+def _readHeaders(paths: [Path]):
+    for p in paths:
+        readHeader(p, SONG_TAGS)
+
+def benchHeaders(paths: [Path]) -> dict:
+    return {
+        'tokenize': _timeit(_tokenizeHeaders, paths),
+        'readHeader': _timeit(_readHeaders, paths)
+    }
+
+def benchCheck(root: Path, jobs: int = 1) -> dict:
+    return {'check': _timeit(check, root, jobs)}
+
+# DMX config loading happens in the constructor, so it is timed on its own
+def benchGenerate(root: Path, dmxroot: Path) -> dict:
+    start = time.perf_counter()
+    sg = SonglistGenerator([root], [dmxroot])
+    loaded = time.perf_counter()
+    sg.generate()
+    return {
+        'dmx-config': loaded - start,
+        'generate': time.perf_counter() - loaded
+    }
+
+# Stand-in for a library on a network share: every txt file that is read first waits for
+# latency seconds, like an open over SMB or NFS waits for a round trip.
+class LatencyGenerator(SonglistGenerator):
+    def __init__(self, paths: [Path], latency: float):
+        super().__init__(paths)
+        self.latency = latency
+
+    def _readSongTags(self, path: str) -> tuple:
+        time.sleep(self.latency)
+        return super()._readSongTags(path)
+
+# generate() against generate_async() on the same slow library; both must give the same list
+def benchNetwork(root: Path, latency: float, concurrency: int) -> dict:
+    import asyncio
+    sg = LatencyGenerator([root], latency)
+    start = time.perf_counter()
+    sg.generate()
+    sequential = time.perf_counter() - start
+    expected = [dict(entry) for entry in sg.getSonglist()]
+    start = time.perf_counter()
+    asyncio.run(sg.generate_async(concurrency))
+    concurrent = time.perf_counter() - start
+    if [dict(entry) for entry in sg.getSonglist()] != expected:
+        raise RuntimeError('generate_async() gave a different songlist than generate()')
+    return {'sequential': sequential, 'concurrent': concurrent}
+
+# a songlist of the given size in songlist order, without files
+def _searchSonglist(songs: int, seed: int) -> [SonglistEntry]:
+    rng = random.Random(seed)
+    songlist = {}
+    for n in range(songs):
+        artist = '{} {}'.format(' '.join(rng.choices(SEARCH_WORDS, k=rng.randint(1, 2))), n // 10)
+        title = '{} {}'.format(' '.join(rng.choices(SEARCH_WORDS, k=rng.randint(1, 4))), n)
+        entry = SonglistEntry(artist, title, rng.choice(LANGUAGES), rng.randint(1950, 2020), SongType.LOSSY, 0)
+        if rng.random() < 0.2:
+            entry.addVariant(rng.choice([SongType.LOSSLESS, SongType.INSTRUMENTAL, SongType.DUET]))
+        songlist[' - '.join([artist, title]).casefold()] = entry
+    return [songlist[identifier] for identifier in sorted(songlist)]
+
+# the arguments of search() for one query of every kind in SEARCH_QUERIES, taken from a song
+def _searchQuery(rng: random.Random, kind: str, song: list) -> dict:
+    words = (song[0] + ' ' + song[1]).split()
+    if kind == 'prefix':
+        # the first keystrokes, which match the most songs
+        word = rng.choice(words)
+        return {'query': word[:rng.randint(1, 3)]}
+    if kind == 'words':
+        return {'query': ' '.join(word[:rng.randint(min(2, len(word)), len(word))] for word in rng.sample(words, 2))}
+    if kind == 'filtered':
+        return {'query': rng.choice(words)[:2], 'language': song[2], 'years': (song[3] - 5, song[3] + 5),
+                'variant': SongType(song[4][-1])}
+    return {'query': rng.choice(words)[:1], 'offset': 200}
+
+# build, save and load the index, and the latency of every kind of query, at every size;
+# queries are repeated and their median and 99th percentile reported
+def benchSearch(sizes: [int], queries: int = 500, seed: int = 0) -> dict:
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'search.json')
+        for size in sizes:
+            songlist = _searchSonglist(size, seed)
+            start = time.perf_counter()
+            search = SonglistSearch.fromSonglist(songlist)
+            result['{} build'.format(size)] = time.perf_counter() - start
+            search.save(path)
+            # like a service starting, without the songlist and the index in memory
+            search = songlist = None
+            start = time.perf_counter()
+            search = SonglistSearch.load(path)
+            result['{} load'.format(size)] = time.perf_counter() - start
+            rng = random.Random(seed)
+            for kind in SEARCH_QUERIES:
+                arguments = [_searchQuery(rng, kind, rng.choice(search.songs)) for i in range(queries)]
+                times = []
+                for kwargs in arguments:
+                    start = time.perf_counter()
+                    search.search(**kwargs)
+                    times.append(time.perf_counter() - start)
+                times.sort()
+                result['{} {}'.format(size, kind)] = statistics.median(times)
+                result['{} {} p99'.format(size, kind)] = times[len(times) * 99 // 100]
+    return result
+
+# runs a transform over every file without writing the result back
+def _transform(paths: [Path], transform):
+    with open(os.devnull, 'w') as output:
+        for p in paths:
+            with open(p, encoding='utf-8') as reader:
+                writeEvents(transform(tokenize(reader)), output)
+
+def benchTransforms(paths: [Path]) -> dict:
+    stages = [stage(name, STAGE_ARGUMENTS.get(name)) for name in STAGES]
+    result = {name: _timeit(_transform, paths, s) for name, s in zip(STAGES, stages)}
+    result['pipeline'] = _timeit(_transform, paths, compose(*stages))
+    return result
+
+# repeated generate() calls on one generator must not grow memory,
+# returns the traced memory in bytes after every round
+def benchSoak(root: Path, rounds: int = 20) -> [int]:
+    sg = SonglistGenerator([root])
+    usage = []
+    tracemalloc.start()
+    try:
+        for i in range(rounds):
+            sg.generate()
+            sg.getSonglist()
+            usage.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    return usage
+
+# Cold start of every subcommand of the ultrastar command: the median wall time of running
+# it with --help, which imports its module and builds its parser. 'python' is the interpreter
+# on its own, which no command can be faster than.
+def benchStartup(runs: int = 20) -> dict:
+    from ultrastar_scripts.__main__ import COMMANDS
+    commands = {'python': [sys.executable, '-c', 'pass']}
+    for name in COMMANDS:
+        commands[name] = [sys.executable, '-m', 'ultrastar_scripts', name, '--help']
+    result = {}
+    for name, command in commands.items():
+        times = []
+        for i in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        result[name] = statistics.median(times)
+    return result
+
+def _maxrss(who) -> int:
+    peak = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes instead of KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+# in KiB, including the processes the benchmark started itself
+def _peakRss():
+    if resource is None:
+        return None
+    try:
+        # ru_maxrss survives the exec of a spawned process on Linux, so it would include the memory
+        # of the parent at the time of the fork; the high water mark of this process does not
+        with open('/proc/self/status') as reader:
+            peak = next(int(line.split()[1]) for line in reader if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        peak = _maxrss(resource.RUSAGE_SELF)
+    return max(peak, _maxrss(resource.RUSAGE_CHILDREN))
+
+def _runBenchmark(name: str, root: Path, dmxroot: Path, paths: [Path], args) -> (dict, int):
+    if name == 'headers':
+        result = benchHeaders(paths)
+    elif name == 'check':
+        result = benchCheck(root, args.jobs)
+    elif name == 'generate':
+        result = benchGenerate(root, dmxroot)
+    elif name == 'network':
+        result = benchNetwork(root, args.latency / 1000, args.concurrency)
+    elif name == 'search':
+        result = benchSearch(args.search_sizes, args.search_queries, args.seed)
+    elif name == 'transforms':
+        result = benchTransforms(paths)
+    elif name == 'startup':
+        result = benchStartup(args.startup_runs)
+    else:
+        usage = benchSoak(root, args.rounds)
+        result = {'first': usage[0], 'last': usage[-1], 'max': max(usage), 'rounds': len(usage)}
+    return result, _peakRss()
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).parent,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# the last saved run that used the same library, or None
+def _previousRun(path: str, library: dict):
+    previous = None
+    try:
+        with open(path) as reader:
+            for line in reader:
+                run = json.loads(line)
+                if run.get('library') == library:
+                    previous = run
+    except FileNotFoundError:
+        pass
+    return previous
+
+def _change(seconds: float, previous: dict, name: str, label: str) -> str:
+    if previous is None or label not in previous['results'].get(name, {}).get('seconds', {}):
+        return ''
+    before = previous['results'][name]['seconds'][label]
+    return ' {:+7.1f}%'.format((seconds - before) / before * 100)
+
+def _report(name: str, result: dict, peak: int, files: int, notes: int, previous: dict, target: float):
+    if name == 'startup':
+        for label, seconds in result.items():
+            line = '{:<20} {:8.1f}ms'.format(label, seconds * 1000)
+            if label != 'python' and seconds * 1000 > target:
+                line += '  over the target of {:.0f}ms'.format(target)
+            print(line + _change(seconds, previous, name, label))
+    elif name == 'search':
+        # queries take microseconds, and do not depend on the files of the library
+        for label, seconds in result.items():
+            print('{:<20} {:10.1f}µs'.format(label, seconds * 1e6) + _change(seconds, previous, name, label))
+    elif name == 'soak':
+        print('{:<20} first {:.1f} KiB, last {:.1f} KiB, max {:.1f} KiB after {} rounds'.format(
+            name, result['first'] / 1024, result['last'] / 1024, result['max'] / 1024, result['rounds']
+        ))
+    else:
+        for label, seconds in result.items():
+            line = '{:<20} {:8.3f}s'.format(label, seconds)
+            # loading the DMX config does not depend on the songs
+            if label != 'dmx-config':
+                line += ' {:10.0f} files/s'.format(files / seconds)
+            if name in NOTE_BENCHMARKS:
+                line += ' {:12.0f} notes/s'.format(notes / seconds)
+            print(line + _change(seconds, previous, name, label))
+    if peak is not None:
+        print('{:<20} peak RSS {:.1f} MiB'.format('', peak / 1024))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ultrastar-scripts on a synthetic library')
+    parser.add_argument('benchmarks', nargs='*', help='Benchmarks to run: ' + ', '.join(BENCHMARKS) + ' (default: all)')
+    parser.add_argument('--songs', type=int, default=5000, help='Number of songs to generate (default: 5000)')
+    parser.add_argument('--notes', type=int, default=300, help='Number of notes per song (default: 300)')
+    parser.add_argument('--duets', type=float, default=0.1, help='Fraction of songs with P1/P2 sections (default: 0.1)')
+    parser.add_argument('--boms', type=float, default=0.1, help='Fraction of songs that start with a BOM (default: 0.1)')
+    parser.add_argument('--variants', type=float, default=0.2, help='Fraction of songs that are a (Lossless), (Instrumental) or (Duet) variant (default: 0.2)')
+    parser.add_argument('--dmx-files', type=int, default=4, help='Number of DMX config files (default: 4)')
+    parser.add_argument('--dmx-entries', type=int, default=250, help='Number of songs per DMX config file (default: 250)')
+    parser.add_argument('--dmx-instructions', type=int, default=20, help='Number of instructions per DMX config entry (default: 20)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic library (default: 0)')
+    parser.add_argument('--rounds', type=int, default=20, help='Number of generate() calls for soak (default: 20)')
+    parser.add_argument('--startup-runs', type=int, default=20, help='Number of runs per command for startup (default: 20)')
+    parser.add_argument('--startup-target', type=float, default=100, metavar='MS', help='Cold start every command should stay under; startup exits with 1 if one does not (default: 100)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes for check (default: 1)')
+    parser.add_argument('--latency', type=float, default=1, metavar='MS', help='Time every file read waits for in network (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of files generate_async() reads at the same time in network (default: 16)')
+    parser.add_argument('--search-sizes', type=lambda value: [int(size) for size in value.split(',')], default=[1000, 10000, 100000],
+                        metavar='N,N,...', help='Songlist sizes for search (default: 1000,10000,100000)')
+    parser.add_argument('--search-queries', type=int, default=500, metavar='N', help='Number of queries of every kind for search (default: 500)')
+    parser.add_argument('--save', metavar='FILE', help='Append the results to this JSON lines file')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with the last run in this JSON lines file that used the same library')
+    args = parser.parse_args()
+    benchmarks = args.benchmarks or BENCHMARKS
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    library = {
+        'songs': args.songs, 'notes': args.notes, 'duets': args.duets, 'boms': args.boms,
+        'variants': args.variants, 'dmx-files': args.dmx_files, 'dmx-entries': args.dmx_entries,
+        'dmx-instructions': args.dmx_instructions, 'seed': args.seed, 'jobs': args.jobs,
+        'latency': args.latency, 'concurrency': args.concurrency, 'search-sizes': args.search_sizes,
+        'search-queries': args.search_queries
+    }
+    previous = _previousRun(args.compare, library) if args.compare else None
+    if previous is not None:
+        print('comparing with {} from {}'.format(previous['commit'], previous['date']))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'songs'
+        dmxroot = Path(tmp) / 'dmx'
+        paths = []
+        # startup and search do not need a library
+        if any(name not in ('startup', 'search') for name in benchmarks):
+            paths = generateLibrary(root, args.songs, args.notes, args.seed, args.duets, args.boms, args.variants)
+            generateDmxConfig(dmxroot, args.songs, args.dmx_files, args.dmx_entries, args.dmx_instructions, args.seed)
+        # spawn, so a benchmark does not inherit the memory of the generator or of earlier benchmarks
+        context = multiprocessing.get_context('spawn')
+        for name in benchmarks:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result, peak = executor.submit(_runBenchmark, name, root, dmxroot, paths, args).result()
+            _report(name, result, peak, len(paths), len(paths) * args.notes, previous, args.startup_target)
+            key = 'memory' if name == 'soak' else 'seconds'
+            results[name] = {key: result, 'peak_rss_kib': peak}
+
+    if args.save:
+        with open(args.save, 'a') as writer:
+            writer.write(json.dumps({
+                'commit': _commit(),
+                'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': '{}.{}.{}'.format(*sys.version_info[:3]),
+                'library': library,
+                'results': results
+            }) + '\n')
+
+    if 'startup' in results:
+        slow = [name for name, seconds in results['startup']['seconds'].items() if name != 'python' and seconds * 1000 > args.startup_target]
+        if slow:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,177 +1,170 @@
 import argparse
 import sys
-import math
 from pathlib import Path
+from functools import partial
 
+from ultrastar_scripts import check_report, check_rules, libultrastar
+from ultrastar_scripts.check_cache import (
+    CACHE_FILENAME,
+    CheckCache,
+    fingerprint,
+    rulesetVersion
+)
+from ultrastar_scripts.check_report import (
+    Finding,
+    writeJsonLines,
+    writeSarif,
+    writeSummary,
+    writeText
+)
+from ultrastar_scripts.check_rules import RULES, RuleEngine
 from ultrastar_scripts.libultrastar import (
-    parseFloatLine,
-    parseIntLine,
-    parseTextLine,
-    minute_fraction_between_beats,
-    print_error
+    Stats,
+    addStatsArguments,
+    findSongFiles,
+    phase,
+    profiled,
+    statsFromArguments
 )
 
-class PlayerInfo:
-    # golden note computations: ideally, 1/17 of all notes are golden (this equals 8000 normal points + 1000 golden points)
-    total_beats = 0
-    golden_beats = 0
+# checks a single txt file with every rule, returns the findings in the order they were found
+def checkFile(p: Path) -> [Finding]:
+    return RuleEngine().run(p)[0]
+
+def _checkPath(p: Path, engine: RuleEngine, fingerprinted: bool, measured: bool = False) -> (Path, (int, int, str), [Finding], dict, dict):
+    # the phases are timed here, in the worker, and added up by the caller
+    filestats = Stats() if measured else None
+    # the fingerprint is taken first, so a file that changes while it is checked is checked again next time
+    fp = None
+    if fingerprinted:
+        with phase(filestats, 'hash'):
+            fp = fingerprint(p)
+    with phase(filestats, 'check'):
+        findings, timings = engine.run(p)
+    return p, fp, findings, timings, filestats and filestats.phases
 
-    def __init__(self, player_number: int):
-        self.player_number = player_number
+# yields (path, findings, timings) for every path, in no particular order
+def _checkFiles(paths, mapper, engine: RuleEngine, cache: CheckCache = None, stats: Stats = None):
+    checkPath = partial(_checkPath, engine=engine, fingerprinted=cache is not None, measured=stats is not None)
+    hits = []
+    def misses():
+        for p in paths:
+            with phase(stats, 'cache'):
+                cached = cache.get(p)
+            if cached is None:
+                yield p
+            else:
+                hits.append((p, [Finding.fromDict(d) for d in cached], None))
+    for p, fp, findings, timings, phases in mapper(checkPath, paths if cache is None else misses()):
+        if cache is not None:
+            cache.put(p, fp, [finding.asDict() for finding in findings])
+        if stats is not None:
+            for name, (wall, cpu) in phases.items():
+                stats.add(name, wall, cpu)
+            stats.addFile(p, sum(wall for wall, cpu in phases.values()))
+        yield p, findings, timings
+    yield from hits
 
-def _fileerror(filename: str, message: str):
-    print('{}: {}'.format(filename, message))
+# Checks every txt file below path and returns the findings, sorted by file.
+# cache is an optional CheckCache, it is not saved. If timings is a dict, the seconds
+# spent per rule are added to it. If stats is given, the phases and files are timed into it.
+def check(path: str, jobs: int = 1, ignore: [str] = (), cache: CheckCache = None, engine: RuleEngine = None, timings: dict = None, stats: Stats = None) -> [Finding]:
+    if engine is None:
+        engine = RuleEngine(timed=timings is not None)
+    # files are checked while the directories are still being scanned, only the result is sorted
+    paths = findSongFiles([path], ignore)
+    if stats is not None:
+        paths = stats.iterate('walk', paths)
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        # forked workers would inherit the profiler of --profile and only get slower from it
+        with ProcessPoolExecutor(max_workers=jobs, initializer=sys.setprofile, initargs=(None,)) as executor:
+            results = list(_checkFiles(paths, partial(executor.map, chunksize=16), engine, cache, stats))
+    else:
+        results = list(_checkFiles(paths, map, engine, cache, stats))
+    results.sort(key=lambda r: r[0])
+    if timings is not None:
+        for p, findings, filetimings in results:
+            for rule, seconds in (filetimings or {}).items():
+                timings[rule] = timings.get(rule, 0) + seconds
+    return [finding for p, findings, filetimings in results for finding in findings]
 
-def _error(filename: str, linenumber: int, message: str):
-    print('{} line {}: {}'.format(filename, linenumber, message))
+def _rules(names: [str]) -> [str]:
+    unknown = [name for name in names if name not in RULES]
+    if unknown:
+        raise argparse.ArgumentTypeError('unknown rule ' + ', '.join(unknown) + ', see --list-rules')
+    return names
 
 def main():
     parser = argparse.ArgumentParser(description='Check Ultrastar txt files')
     parser.add_argument('path', nargs='?', type=str, default='.', help='Path to look for txt files (default: .)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files to check in parallel (default: 1)')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN', help='Skip directories whose name matches this pattern, can be given multiple times')
+    parser.add_argument('--cache', action='store_true', help='Only check files that changed since the last run (cache is stored in ' + CACHE_FILENAME + ' in path)')
+    parser.add_argument('--cache-file', type=str, help='Use this cache file instead of the one in path (implies --cache)')
+    parser.add_argument('-f', '--format', choices=['text', 'jsonl', 'sarif'], default='text', help='Output format (default: text)')
+    parser.add_argument('--summary', action='store_true', help='Print the number of findings per rule to standard error')
+    parser.add_argument('--enable', action='append', default=[], metavar='RULE', help='Only run this rule, can be given multiple times')
+    parser.add_argument('--disable', action='append', default=[], metavar='RULE', help='Do not run this rule, can be given multiple times')
+    parser.add_argument('--list-rules', action='store_true', help='List all rules and exit')
+    parser.add_argument('--timings', action='store_true', help='Print the time spent per rule to standard error')
+    parser.add_argument('--watch', action='store_true', help='Keep running and check files again when they change, printing only the findings that were added (+) or removed (-)')
+    parser.add_argument('--poll', type=float, metavar='SECONDS', help='With --watch, look for changes every SECONDS instead of using inotify')
+    parser.add_argument('--socket', type=str, metavar='PATH', help='With --watch, serve the current findings on this Unix socket: send a file name (or nothing for all files) and a newline, get JSON lines back')
+    addStatsArguments(parser)
     args = parser.parse_args()
-    path=args.path
+    if args.watch and args.format == 'sarif':
+        parser.error('--watch does not work with -f sarif')
+    if (args.poll is not None or args.socket) and not args.watch:
+        parser.error('--poll and --socket need --watch')
 
-    for p in sorted(Path(path).glob('**/*.txt')):
-        with open(p) as reader:
-            players = [PlayerInfo(1)]
-            active_player = players[0]
-            end = False
-            bpm = 0
-            two_seconds = 0
-            prevnoteline = None
-            prevlinebreak = None
-            songlinenum = 1
-            songlinenotenum = 0
-            # some other things checked at the end of a file
-            year = None
-            genre = None
-            edition = None
-            language = None
-            for i, line in enumerate(reader):
-                # remove BOM
-                if line.startswith('\ufeff'):
-                    line = line[1:]
-                if end:
-                    _error(p, i, 'extra lines after end')
-                elif line.startswith('#BPM:'):
-                    bpm = parseFloatLine(line)
-                elif line.startswith('#YEAR:'):
-                    year = parseIntLine(line)
-                elif line.startswith('#GENRE:'):
-                    genre = parseTextLine(line)
-                elif line.startswith('#EDITION:'):
-                    edition = parseTextLine(line)
-                elif line.startswith('#LANGUAGE:'):
-                    language = parseTextLine(line)
-                elif line.startswith('P'):
-                    new_player_number = int(line[1:])
-                    while len(players) < new_player_number:
-                        players.append(PlayerInfo(len(players) + 1))
-                    active_player = players[new_player_number - 1]
-                    prevnoteline = None
-                    prevlinebreak = None
-                elif line.startswith('-'):
-                    # linebreak
-                    if prevlinebreak:
-                        _error(p, i, 'multiple linebreaks')
-                    if not prevnoteline:
-                        _error(p, i, 'linebreak without preceding note')
-                    else:
-                        prevparts = prevnoteline.split(' ')
-                        prevend = int(prevparts[1]) + int(prevparts[2])
-                        linebreak = int(line.split(' ')[1])
-                        if linebreak < prevend:
-                            _error(p, i, 'linebreak too early')
-                    prevlinebreak = line
-                    songlinenum += 1
-                    songlinenotenum = 0
-                elif line.startswith('E'):
-                    end = True
-                elif not line.startswith('#'):
-                    songlinenotenum += 1
-                    # note
-                    parts = line.split(' ', 4)
-                    thistype = parts[0]
-                    thislength = int(parts[2])
-                    if thistype != 'F':
-                        active_player.total_beats += thislength
-                        if thistype == '*':
-                            active_player.golden_beats += thislength
+    if args.list_rules:
+        for id, cls in RULES.items():
+            print('{:<24}{:<9}{}'.format(id, cls.severity, cls.description))
+        return
+    try:
+        enabled = _rules(args.enable) or list(RULES)
+        disabled = _rules(args.disable)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    engine = RuleEngine([id for id in enabled if id not in disabled], timed=args.timings)
 
-                    if prevnoteline:
-                        prevparts = prevnoteline.split(' ', 4)
-                        prevlength = int(prevparts[2])
-                        prevend = int(prevparts[1]) + prevlength
-                        start = int(parts[1])
-                        if start < prevend:
-                            _error(p, i, 'note starts too early')
+    findings = profiled(args.profile, _run, args, engine)
+    if args.watch:
+        # imported here, it is only needed in watch mode
+        from ultrastar_scripts.check_watch import watch
+        try:
+            watch(args.path, engine, findings, args.ignore, args.poll is not None, args.poll or 1.0, args.socket, sys.stdout, args.format)
+        except KeyboardInterrupt:
+            pass
 
-                        if prevlinebreak:
-                            # do some extra linebreak-related checks
-                            linebreak = int(prevlinebreak.split(' ')[1])
-                            if start < linebreak:
-                                _error(p, i, 'note starts too early')
-                            elif start - 1 < linebreak:
-                                _error(p, i, 'note starts less than 1 beat after linebreak')
-                            # check if the linebreak is at a sensible place
-                            # shared code with fix_linebreaks is deliberately duplicated for performance
-                            fraction = minute_fraction_between_beats(prevend, start, bpm)
-                            pause = start - prevend
-                            if pause >= 2 and pause <= 8:
-                                # 2-8 beats
-                                optimalLinebreak = start - 2
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is 2-8 beats, so linebreak 2 beats before (beat {})'.format(optimalLinebreak))
-                            if pause >= 9 and pause <= 12:
-                                # 9-12 beats
-                                optimalLinebreak = start - 3
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is 9-12 beats, so linebreak 3 beats before (beat {})'.format(optimalLinebreak))
-                            elif pause >= 13 and pause <= 16:
-                                # 13-16 beats
-                                optimalLinebreak = start - 4
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is 13-16 beats, so linebreak 4 beats before (beat {})'.format(optimalLinebreak))
-                            elif fraction > 0.066:
-                                # four seconds
-                                optimalLinebreak = prevend + round(bpm/7.5)
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is more than 4s, so linebreak after 2s (beat {})'.format(optimalLinebreak))
-                            elif fraction > 0.033:
-                                # > two seconds
-                                optimalLinebreak = prevend + math.floor(bpm/15)
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is more than 2s, so linebreak after 1s (beat {})'.format(optimalLinebreak))
-                            # ~ elif fraction > 0.016:
-                                # ~ # > one second
-                                # ~ optimalLinebreak = prevend + math.ceil(bpm/30)
-                                # ~ if linebreak != optimalLinebreak:
-                                    # ~ _error(p, i, 'pause is more than 1s, so linebreak after 0.5s (beat {})'.format(optimalLinebreak))
-                            elif pause > 16:
-                                optimalLinebreak = prevend + 10
-                                if linebreak != optimalLinebreak:
-                                    _error(p, i, 'pause is more than 16 beats but less than 1s, so linebreak after 10 beats (beat {})'.format(optimalLinebreak))
+def _run(args, engine: RuleEngine):
+    path = args.path
+    stats = statsFromArguments(args)
+    cache = None
+    if args.cache or args.cache_file:
+        cache_file = args.cache_file or Path(path) / CACHE_FILENAME
+        with phase(stats, 'cache'):
+            cache = CheckCache(cache_file, rulesetVersion([check_rules, check_report, libultrastar], engine.ruleIds()))
 
-                            prevlinebreak = None
+    timings = {} if args.timings else None
+    findings = check(path, args.jobs, args.ignore, cache, engine, timings, stats)
+    with phase(stats, 'output'):
+        if args.format == 'jsonl':
+            writeJsonLines(findings, sys.stdout)
+        elif args.format == 'sarif':
+            writeSarif(findings, sys.stdout, {cls.id: (cls.severity, cls.description) for cls in engine.rules})
+        else:
+            writeText(findings, sys.stdout)
+    if args.summary:
+        writeSummary(findings, sys.stderr)
+    if args.timings:
+        for rule, seconds in sorted(timings.items(), key=lambda t: t[1], reverse=True):
+            sys.stderr.write('{:<24}{:8.3f}s\n'.format(rule, seconds))
 
-                    prevnoteline = line
-            # golden note computations
-            for player in players:
-                idealGoldenBeats = round(player.total_beats / 17)
-                if player.golden_beats != idealGoldenBeats:
-                    message = 'ideal golden beats'
-                    if len(players) > 1:
-                        message += ' for P' + str(player.player_number)
-                    _fileerror(p, message + ' = ' + str(idealGoldenBeats) + ' (current = ' + str(player.golden_beats) + ')')
-            # some other things checked at the end of a file
-            if year is None:
-                _fileerror(p, '#YEAR is not set')
-            elif year < 1900 or year > 2100:
-                _fileerror(p, '#YEAR probably has an incorrect value, current value = ' + str(year))
-            if language is None:
-                _fileerror(p, '#LANGUAGE is not set')
-            if genre is None:
-                _fileerror(p, '#GENRE is not set')
-            # this check is for My Little Karaoke
-            elif genre == 'Pony' and edition != 'My Little Pony':
-                _fileerror(p, 'if #GENRE is "Pony", #EDITION should be set to "My Little Pony"')
+    if cache:
+        with phase(stats, 'cache'):
+            cache.save()
+    if stats is not None:
+        stats.write(sys.stderr)
+    return findings
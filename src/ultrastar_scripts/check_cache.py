@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+
+# hashlib and json are imported when a cache is used, a run without --cache does not need them
+
+# bump this when the layout of the cache file changes
+CACHE_FORMAT = 1
+CACHE_FILENAME = '.ultrastar-check-cache.json'
+
+# the version of the checks is the hash of the source files that implement them and the
+# enabled rules, so any change to a check or to --enable/--disable invalidates the whole cache
+def rulesetVersion(modules: list, rules: [str] = ()) -> str:
+    import hashlib
+    h = hashlib.sha1(str(CACHE_FORMAT).encode())
+    for module in modules:
+        h.update(Path(module.__file__).read_bytes())
+    h.update(','.join(rules).encode())
+    return h.hexdigest()
+
+def hashFile(path: Path) -> str:
+    import hashlib
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+def fingerprint(path: Path) -> (int, int, str):
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size, hashFile(path)
+
+class CheckCache:
+    def __init__(self, path: Path, version: str):
+        self.path = Path(path)
+        self.version = version
+        self.__entries = {}
+        self.__seen = {}
+        import json
+        try:
+            with open(self.path) as reader:
+                data = json.load(reader)
+            if data.get('version') == version:
+                self.__entries = data['files']
+        except (OSError, ValueError, KeyError):
+            # a missing or broken cache is simply an empty one
+            pass
+
+    # returns the cached errors, or None if the file has to be checked again
+    def get(self, path: Path):
+        key = str(path)
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        stat = path.stat()
+        if entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            # touched, but possibly not changed
+            if entry['hash'] != hashFile(path):
+                return None
+            entry['mtime'] = stat.st_mtime_ns
+            entry['size'] = stat.st_size
+        self.__seen[key] = entry
+        return entry['errors']
+
+    def put(self, path: Path, fingerprint: (int, int, str), errors: [str]):
+        mtime, size, digest = fingerprint
+        self.__seen[str(path)] = {'mtime': mtime, 'size': size, 'hash': digest, 'errors': errors}
+
+    # only files that were seen during this run are kept, so deleted files drop out
+    def save(self):
+        import json
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as writer:
+            json.dump({'version': self.version, 'files': self.__seen}, writer)
+        os.replace(tmp, self.path)
@@ -0,0 +1,89 @@
+from collections import Counter
+from pathlib import Path
+
+SEVERITIES = ('error', 'warning')
+
+class Finding:
+    __slots__ = ('rule', 'file', 'line', 'severity', 'message')
+
+    def __init__(self, rule: str, file: str, line: int, severity: str, message: str):
+        self.rule = rule
+        self.file = file
+        # 1-based, or None if the finding is about the file as a whole
+        self.line = line
+        self.severity = severity
+        self.message = message
+
+    def __str__(self):
+        if self.line is None:
+            return '{}: {}'.format(self.file, self.message)
+        return '{} line {}: {}'.format(self.file, self.line, self.message)
+
+    def asDict(self) -> dict:
+        return {
+            'rule': self.rule,
+            'file': self.file,
+            'line': self.line,
+            'severity': self.severity,
+            'message': self.message
+        }
+
+    @classmethod
+    def fromDict(cls, d: dict):
+        return cls(d['rule'], d['file'], d['line'], d['severity'], d['message'])
+
+def countByRule(findings: [Finding]) -> Counter:
+    return Counter(finding.rule for finding in findings)
+
+def writeText(findings: [Finding], output):
+    for finding in findings:
+        output.write(str(finding) + '\n')
+
+# json is only imported for the formats that need it
+def writeJsonLines(findings: [Finding], output):
+    import json
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    for finding in findings:
+        output.write(encoder.encode(finding.asDict()) + '\n')
+
+# rules: rule id -> (severity, description)
+def writeSarif(findings: [Finding], output, rules: dict):
+    import json
+    from urllib.parse import quote
+    results = []
+    for finding in findings:
+        # song folders nearly always have spaces, which a URI reference cannot contain
+        location = {'artifactLocation': {'uri': quote(Path(finding.file).as_posix())}}
+        if finding.line is not None:
+            location['region'] = {'startLine': finding.line}
+        results.append({
+            'ruleId': finding.rule,
+            'level': finding.severity,
+            'message': {'text': finding.message},
+            'locations': [{'physicalLocation': location}]
+        })
+    json.dump({
+        '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+        'version': '2.1.0',
+        'runs': [{
+            'tool': {'driver': {
+                'name': 'ultrastar-check',
+                'informationUri': 'https://github.com/barbeque-squared/ultrastar-scripts',
+                'rules': [
+                    {
+                        'id': rule,
+                        'shortDescription': {'text': description},
+                        'defaultConfiguration': {'level': severity}
+                    }
+                    for rule, (severity, description) in sorted(rules.items())
+                ]
+            }},
+            'results': results
+        }]
+    }, output, indent=2)
+    output.write('\n')
+
+def writeSummary(findings: [Finding], output):
+    for rule, count in sorted(countByRule(findings).items()):
+        output.write('{}: {}\n'.format(rule, count))
+    output.write('total: {}\n'.format(len(findings)))
@@ -0,0 +1,390 @@
+import math
+from collections import defaultdict
+from time import perf_counter
+
+from ultrastar_scripts.check_report import Finding
+from ultrastar_scripts.libultrastar import (
+    End,
+    Linebreak,
+    Note,
+    PlayerChange,
+    Tag,
+    parseFloat,
+    parseInt,
+    minute_fraction_between_beats,
+    readLines,
+    tokenize
+)
+
+# Every check is a Rule that subscribes to the events it needs by overriding the matching hook.
+# The engine parses a file once and only calls the hooks of the enabled rules. Rules are
+# called in registration order, which is also the order of their findings for one line.
+
+# rule id -> Rule subclass, in registration order
+RULES = {}
+
+HOOKS = ('onTag', 'onNote', 'onNoteAfterLinebreak', 'onLinebreak', 'onPlayerChange', 'onEnd', 'onAfterEnd', 'onFinish')
+
+def rule(cls):
+    RULES[cls.id] = cls
+    return cls
+
+# state of the file being checked, shared by all rules and kept up to date by the engine
+class CheckContext:
+    def __init__(self, path):
+        self.path = str(path)
+        self.findings = []
+        self.bpm = 0
+        self.year = None
+        self.genre = None
+        self.edition = None
+        self.language = None
+        # only within the current player
+        self.prevnote = None
+        self.prevlinebreak = None
+        self.end = False
+
+class Rule:
+    id = None
+    severity = 'warning'
+    description = ''
+
+    def __init__(self, context: CheckContext):
+        self.context = context
+
+    def report(self, event, message: str):
+        self.context.findings.append(Finding(self.id, self.context.path, event.index + 1, self.severity, message))
+
+    def reportFile(self, message: str):
+        self.context.findings.append(Finding(self.id, self.context.path, None, self.severity, message))
+
+    # the hooks; prevnote and prevlinebreak in the context do not include the event yet
+    def onTag(self, event: Tag):
+        pass
+
+    def onNote(self, event: Note):
+        pass
+
+    # the first note after a linebreak, only if a note precedes the linebreak; called after onNote
+    def onNoteAfterLinebreak(self, event: Note):
+        pass
+
+    def onLinebreak(self, event: Linebreak):
+        pass
+
+    def onPlayerChange(self, event: PlayerChange):
+        pass
+
+    def onEnd(self, event: End):
+        pass
+
+    # any line after E
+    def onAfterEnd(self, event):
+        pass
+
+    # end of the file
+    def onFinish(self):
+        pass
+
+@rule
+class TrailingLines(Rule):
+    id = 'trailing-lines'
+    severity = 'error'
+    description = 'Lines after the end of the song'
+
+    def onAfterEnd(self, event):
+        self.report(event, 'extra lines after end')
+
+@rule
+class LinebreakDuplicate(Rule):
+    id = 'linebreak-duplicate'
+    severity = 'error'
+    description = 'Multiple linebreaks in a row'
+
+    def onLinebreak(self, event: Linebreak):
+        if self.context.prevlinebreak:
+            self.report(event, 'multiple linebreaks')
+
+@rule
+class LinebreakOrphan(Rule):
+    id = 'linebreak-orphan'
+    severity = 'error'
+    description = 'Linebreak without a preceding note'
+
+    def onLinebreak(self, event: Linebreak):
+        if not self.context.prevnote:
+            self.report(event, 'linebreak without preceding note')
+
+@rule
+class LinebreakEarly(Rule):
+    id = 'linebreak-early'
+    severity = 'error'
+    description = 'Linebreak before the end of the preceding note'
+
+    def onLinebreak(self, event: Linebreak):
+        prevnote = self.context.prevnote
+        if prevnote and event.start < prevnote.end:
+            self.report(event, 'linebreak too early')
+
+@rule
+class NoteOverlap(Rule):
+    id = 'note-overlap'
+    severity = 'error'
+    description = 'Note starts before the end of the preceding note'
+
+    def onNote(self, event: Note):
+        prevnote = self.context.prevnote
+        if prevnote and event.start < prevnote.end:
+            self.report(event, 'note starts too early')
+
+@rule
+class NoteBeforeLinebreak(Rule):
+    id = 'note-before-linebreak'
+    severity = 'error'
+    description = 'Note starts before the preceding linebreak'
+
+    def onNoteAfterLinebreak(self, event: Note):
+        if event.start < self.context.prevlinebreak.start:
+            self.report(event, 'note starts too early')
+
+@rule
+class NoteAfterLinebreak(Rule):
+    id = 'note-after-linebreak'
+    severity = 'warning'
+    description = 'Note starts less than 1 beat after the linebreak'
+
+    def onNoteAfterLinebreak(self, event: Note):
+        linebreak = self.context.prevlinebreak.start
+        if not event.start < linebreak and event.start - 1 < linebreak:
+            self.report(event, 'note starts less than 1 beat after linebreak')
+
+@rule
+class LinebreakPlacement(Rule):
+    id = 'linebreak-placement'
+    severity = 'warning'
+    description = 'Linebreak is not at the optimal position for the pause'
+
+    def onNoteAfterLinebreak(self, event: Note):
+        context = self.context
+        prevend = context.prevnote.end
+        start = event.start
+        linebreak = context.prevlinebreak.start
+        bpm = context.bpm
+        if start < prevend or bpm <= 0:
+            # overlapping notes are reported by note-overlap, a missing #BPM makes this meaningless
+            return
+        # check if the linebreak is at a sensible place
+        # shared code with fix_linebreaks is deliberately duplicated for performance
+        fraction = minute_fraction_between_beats(prevend, start, bpm)
+        pause = start - prevend
+        if pause >= 2 and pause <= 8:
+            # 2-8 beats
+            optimalLinebreak = start - 2
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is 2-8 beats, so linebreak 2 beats before (beat {})'.format(optimalLinebreak))
+        if pause >= 9 and pause <= 12:
+            # 9-12 beats
+            optimalLinebreak = start - 3
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is 9-12 beats, so linebreak 3 beats before (beat {})'.format(optimalLinebreak))
+        elif pause >= 13 and pause <= 16:
+            # 13-16 beats
+            optimalLinebreak = start - 4
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is 13-16 beats, so linebreak 4 beats before (beat {})'.format(optimalLinebreak))
+        elif fraction > 0.066:
+            # four seconds
+            optimalLinebreak = prevend + round(bpm/7.5)
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is more than 4s, so linebreak after 2s (beat {})'.format(optimalLinebreak))
+        elif fraction > 0.033:
+            # > two seconds
+            optimalLinebreak = prevend + math.floor(bpm/15)
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is more than 2s, so linebreak after 1s (beat {})'.format(optimalLinebreak))
+        # ~ elif fraction > 0.016:
+            # ~ # > one second
+            # ~ optimalLinebreak = prevend + math.ceil(bpm/30)
+            # ~ if linebreak != optimalLinebreak:
+                # ~ self.report(event, 'pause is more than 1s, so linebreak after 0.5s (beat {})'.format(optimalLinebreak))
+        elif pause > 16:
+            optimalLinebreak = prevend + 10
+            if linebreak != optimalLinebreak:
+                self.report(event, 'pause is more than 16 beats but less than 1s, so linebreak after 10 beats (beat {})'.format(optimalLinebreak))
+
+class PlayerInfo:
+    def __init__(self, player_number: int):
+        self.player_number = player_number
+        self.total_beats = 0
+        self.golden_beats = 0
+
+@rule
+class GoldenRatio(Rule):
+    id = 'golden-ratio'
+    severity = 'warning'
+    description = 'Golden beats are not 1/17 of all beats'
+
+    # golden note computations: ideally, 1/17 of all notes are golden (this equals 8000 normal points + 1000 golden points)
+    def __init__(self, context: CheckContext):
+        super().__init__(context)
+        self.players = [PlayerInfo(1)]
+        self.active_player = self.players[0]
+
+    def onPlayerChange(self, event: PlayerChange):
+        while len(self.players) < event.player:
+            self.players.append(PlayerInfo(len(self.players) + 1))
+        self.active_player = self.players[event.player - 1]
+
+    def onNote(self, event: Note):
+        if event.type != 'F':
+            self.active_player.total_beats += event.length
+            if event.type == '*':
+                self.active_player.golden_beats += event.length
+
+    def onFinish(self):
+        for player in self.players:
+            idealGoldenBeats = round(player.total_beats / 17)
+            if player.golden_beats != idealGoldenBeats:
+                message = 'ideal golden beats'
+                if len(self.players) > 1:
+                    message += ' for P' + str(player.player_number)
+                self.reportFile(message + ' = ' + str(idealGoldenBeats) + ' (current = ' + str(player.golden_beats) + ')')
+
+@rule
+class YearMissing(Rule):
+    id = 'year-missing'
+    description = '#YEAR is not set'
+
+    def onFinish(self):
+        if self.context.year is None:
+            self.reportFile('#YEAR is not set')
+
+@rule
+class YearRange(Rule):
+    id = 'year-range'
+    description = '#YEAR is outside 1900-2100'
+
+    def onFinish(self):
+        year = self.context.year
+        if year is not None and (year < 1900 or year > 2100):
+            self.reportFile('#YEAR probably has an incorrect value, current value = ' + str(year))
+
+@rule
+class LanguageMissing(Rule):
+    id = 'language-missing'
+    description = '#LANGUAGE is not set'
+
+    def onFinish(self):
+        if self.context.language is None:
+            self.reportFile('#LANGUAGE is not set')
+
+@rule
+class GenreMissing(Rule):
+    id = 'genre-missing'
+    description = '#GENRE is not set'
+
+    def onFinish(self):
+        if self.context.genre is None:
+            self.reportFile('#GENRE is not set')
+
+# this check is for My Little Karaoke
+@rule
+class PonyEdition(Rule):
+    id = 'pony-edition'
+    description = '#GENRE Pony requires #EDITION My Little Pony'
+
+    def onFinish(self):
+        if self.context.genre == 'Pony' and self.context.edition != 'My Little Pony':
+            self.reportFile('if #GENRE is "Pony", #EDITION should be set to "My Little Pony"')
+
+def _timed(handler, timings: dict, key: str):
+    def timedHandler(*args):
+        start = perf_counter()
+        handler(*args)
+        timings[key] += perf_counter() - start
+    return timedHandler
+
+class RuleEngine:
+    def __init__(self, enabled: [str] = None, timed: bool = False):
+        # registration order is kept, whatever order enabled is in
+        enabled = RULES.keys() if enabled is None else set(enabled)
+        self.rules = [cls for id, cls in RULES.items() if id in enabled]
+        self.timed = timed
+        # per rule class, the hooks it overrides
+        self.__hooks = [
+            (cls, [hook for hook in HOOKS if getattr(cls, hook) is not getattr(Rule, hook)])
+            for cls in self.rules
+        ]
+
+    def ruleIds(self) -> [str]:
+        return [cls.id for cls in self.rules]
+
+    # returns the findings, and the seconds spent per rule if the engine is timed (otherwise None)
+    def run(self, path) -> ([Finding], dict):
+        context = CheckContext(path)
+        timings = defaultdict(float) if self.timed else None
+        dispatch = {hook: [] for hook in HOOKS}
+        for cls, hooks in self.__hooks:
+            instance = cls(context)
+            for hook in hooks:
+                handler = getattr(instance, hook)
+                if timings is not None:
+                    handler = _timed(handler, timings, cls.id)
+                dispatch[hook].append(handler)
+        onTag = dispatch['onTag']
+        onNote = dispatch['onNote']
+        onNoteAfterLinebreak = dispatch['onNoteAfterLinebreak']
+        onLinebreak = dispatch['onLinebreak']
+        onPlayerChange = dispatch['onPlayerChange']
+        onEnd = dispatch['onEnd']
+        onAfterEnd = dispatch['onAfterEnd']
+
+        for event in tokenize(readLines(path)):
+            if context.end:
+                for handler in onAfterEnd:
+                    handler(event)
+            elif isinstance(event, Note):
+                for handler in onNote:
+                    handler(event)
+                if context.prevnote:
+                    if context.prevlinebreak:
+                        for handler in onNoteAfterLinebreak:
+                            handler(event)
+                        context.prevlinebreak = None
+                context.prevnote = event
+            elif isinstance(event, Linebreak):
+                for handler in onLinebreak:
+                    handler(event)
+                context.prevlinebreak = event
+            elif isinstance(event, Tag):
+                self.__readTag(context, event)
+                for handler in onTag:
+                    handler(event)
+            elif isinstance(event, PlayerChange):
+                context.prevnote = None
+                context.prevlinebreak = None
+                for handler in onPlayerChange:
+                    handler(event)
+            elif isinstance(event, End):
+                context.end = True
+                for handler in onEnd:
+                    handler(event)
+        for handler in dispatch['onFinish']:
+            handler()
+        return context.findings, timings
+
+    @staticmethod
+    def __readTag(context: CheckContext, event: Tag):
+        if event.value is None:
+            return
+        key = event.key
+        if key == 'BPM':
+            context.bpm = parseFloat(event.value)
+        elif key == 'YEAR':
+            context.year = parseInt(event.value)
+        elif key == 'GENRE':
+            context.genre = event.value or None
+        elif key == 'EDITION':
+            context.edition = event.value or None
+        elif key == 'LANGUAGE':
+            context.language = event.value or None
@@ -0,0 +1,312 @@
+import io
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path
+
+from ultrastar_scripts.check_report import Finding, writeJsonLines
+from ultrastar_scripts.check_rules import RuleEngine
+from ultrastar_scripts.libultrastar import findSongFiles, print_error
+
+# Watch mode for ultrastar-check: after the first full check the process stays running, and
+# every txt file that changes is checked again on its own. Only the difference in findings
+# is printed, "+ finding" for new ones and "- finding" for ones that are gone.
+#
+# Changes come from inotify on Linux and from polling the mtimes elsewhere. With a socket,
+# editors can ask for the current findings: connect, send a file name (or an empty line for
+# all files) followed by a newline, and read JSON lines until the connection is closed.
+
+# editors save in several steps, changes are collected this long before checking
+DEBOUNCE = 0.1
+
+class InotifyWatcher:
+    # from <sys/inotify.h>
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, path: str, ignore: [str] = ()):
+        import ctypes
+        import ctypes.util
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.__get_errno = ctypes.get_errno
+        self.__ignore = tuple(ignore)
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            self.__raise()
+        # watch descriptor -> directory
+        self.__watches = {}
+        self.__add(path)
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith('linux')
+
+    def __raise(self):
+        errno = self.__get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    # watches directory and everything below it, returns the txt files found on the way
+    def __add(self, directory: str) -> [Path]:
+        files = []
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            # gone again, or not readable: the same as what findSongFiles skips
+            return files
+        self.__watches[wd] = directory
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not any(fnmatch(entry.name, pattern) for pattern in self.__ignore):
+                            files += self.__add(entry.path)
+                    elif entry.name.endswith('.txt'):
+                        files.append(Path(entry.path))
+        except OSError:
+            pass
+        return files
+
+    def fileno(self) -> int:
+        return self.__fd
+
+    # returns the txt files and the directories that changed, or None if events were lost
+    # and everything has to be checked again
+    def read(self) -> set:
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.__fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    return None
+                if mask & self.IN_IGNORED:
+                    self.__watches.pop(wd, None)
+                    continue
+                directory = self.__watches.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & self.IN_ISDIR:
+                    if any(fnmatch(name, pattern) for pattern in self.__ignore):
+                        continue
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        changed.update(self.__add(path))
+                    else:
+                        changed.add(Path(path))
+                elif name.endswith('.txt') and not mask & self.IN_CREATE:
+                    # a created file is reported again when it is closed after writing
+                    changed.add(Path(path))
+
+    def close(self):
+        os.close(self.__fd)
+
+class PollingWatcher:
+    def __init__(self, path: str, ignore: [str] = ()):
+        self.__path = path
+        self.__ignore = ignore
+        self.__snapshot = self.__scan()
+
+    def __scan(self) -> dict:
+        snapshot = {}
+        for p in findSongFiles([self.__path], self.__ignore):
+            try:
+                stat = p.stat()
+            except OSError:
+                continue
+            snapshot[p] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    # returns the txt files that were added, changed or removed since the previous call
+    def read(self) -> set:
+        old = self.__snapshot
+        self.__snapshot = new = self.__scan()
+        return {p for p in old.keys() | new.keys() if old.get(p) != new.get(p)}
+
+    def close(self):
+        pass
+
+# the line is left out, so inserting a line does not report every finding below it again
+def _key(finding: Finding) -> tuple:
+    return finding.rule, finding.message
+
+# the findings of a that are not in b, counting duplicates
+def _missing(a: [Finding], b: [Finding]) -> [Finding]:
+    remaining = Counter(_key(finding) for finding in b)
+    missing = []
+    for finding in a:
+        key = _key(finding)
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            missing.append(finding)
+    return missing
+
+def _writeChanges(removed: [Finding], added: [Finding], output, format: str):
+    if format == 'jsonl':
+        for change, findings in (('removed', removed), ('added', added)):
+            for finding in findings:
+                output.write(json.dumps(dict(change=change, **finding.asDict()), separators=(',', ':')) + '\n')
+    else:
+        for finding in removed:
+            output.write('- ' + str(finding) + '\n')
+        for finding in added:
+            output.write('+ ' + str(finding) + '\n')
+
+class _Server:
+    def __init__(self, path: str, state: dict):
+        self.path = path
+        self.__state = state
+        if os.path.exists(path):
+            # left behind by a previous run
+            os.unlink(path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(path)
+        self.socket.listen()
+        self.socket.setblocking(False)
+        # client socket -> bytes received so far
+        self.clients = {}
+
+    def accept(self, selector):
+        client, address = self.socket.accept()
+        client.setblocking(False)
+        self.clients[client] = b''
+        selector.register(client, selectors.EVENT_READ)
+
+    def receive(self, client, selector):
+        data = client.recv(4096)
+        self.clients[client] += data
+        if data and b'\n' not in self.clients[client]:
+            return
+        request = self.clients.pop(client).partition(b'\n')[0].decode('utf-8', 'replace').strip()
+        selector.unregister(client)
+        output = io.StringIO()
+        writeJsonLines(self.__findings(request), output)
+        try:
+            client.setblocking(True)
+            client.settimeout(1)
+            client.sendall(output.getvalue().encode('utf-8'))
+        except OSError:
+            pass
+        client.close()
+
+    def __findings(self, request: str) -> [Finding]:
+        if not request:
+            return [finding for p in sorted(self.__state) for finding in self.__state[p]]
+        wanted = os.path.abspath(request)
+        return [finding for p in self.__state if os.path.abspath(p) == wanted for finding in self.__state[p]]
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.socket.close()
+        os.unlink(self.path)
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+# Watches path until interrupted (SIGINT or SIGTERM). findings are the findings of the full check that was just
+# done, the state that changes are compared against.
+def watch(path: str, engine: RuleEngine, findings: [Finding], ignore: [str] = (), poll: bool = False,
+          interval: float = 1.0, socketpath: str = None, output=sys.stdout, format: str = 'text'):
+    state = {}
+    for finding in findings:
+        state.setdefault(Path(finding.file), []).append(finding)
+
+    if poll or not InotifyWatcher.available():
+        watcher = PollingWatcher(path, ignore)
+    else:
+        watcher = InotifyWatcher(path, ignore)
+    selector = selectors.DefaultSelector()
+    if isinstance(watcher, InotifyWatcher):
+        selector.register(watcher, selectors.EVENT_READ)
+    server = None
+    if socketpath is not None:
+        server = _Server(socketpath, state)
+        selector.register(server.socket, selectors.EVENT_READ)
+
+    pending = set()
+    deadline = None
+    nextpoll = time.monotonic() + interval
+    # stopping it as a service should clean up the socket as well
+    sigterm = signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while True:
+            now = time.monotonic()
+            if isinstance(watcher, PollingWatcher):
+                timeout = max(0, nextpoll - now)
+            elif deadline is not None:
+                timeout = max(0, deadline - now)
+            else:
+                timeout = None
+            for key, events in selector.select(timeout):
+                if key.fileobj is watcher:
+                    changed = watcher.read()
+                    # lost events: check every file that was or is there
+                    pending |= set(state) | set(findSongFiles([path], ignore)) if changed is None else changed
+                    # events that change no txt file (covers, swap files) do not wake it up again
+                    if pending and deadline is None:
+                        deadline = time.monotonic() + DEBOUNCE
+                elif server is not None and key.fileobj is server.socket:
+                    server.accept(selector)
+                else:
+                    server.receive(key.fileobj, selector)
+            now = time.monotonic()
+            if isinstance(watcher, PollingWatcher) and now >= nextpoll:
+                pending |= watcher.read()
+                deadline = now
+                nextpoll = now + interval
+            if deadline is not None and now >= deadline:
+                if pending:
+                    _recheck(pending, state, engine, output, format)
+                pending = set()
+                deadline = None
+    finally:
+        signal.signal(signal.SIGTERM, sigterm)
+        selector.close()
+        watcher.close()
+        if server is not None:
+            server.close()
+
+def _recheck(paths: set, state: dict, engine: RuleEngine, output, format: str):
+    files = set()
+    for p in paths:
+        if p.suffix == '.txt':
+            files.add(p)
+        else:
+            # a directory that was removed or moved away
+            files.update(known for known in state if p in known.parents)
+    for p in sorted(files):
+        old = state.get(p, [])
+        try:
+            new = engine.run(p)[0] if p.is_file() else []
+        except (OSError, ValueError, IndexError, UnicodeDecodeError) as e:
+            # most likely still being written, it is checked again on the next change
+            print_error('{}: {}'.format(p, e))
+            continue
+        _writeChanges(_missing(old, new), _missing(new, old), output, format)
+        if new:
+            state[p] = new
+        else:
+            state.pop(p, None)
+    output.flush()
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+
+from ultrastar_scripts.check_rules import GoldenRatio, LinebreakPlacement, NoteOverlap
+from ultrastar_scripts.libultrastar import addStatsArguments, phase, profiled, statsFromArguments
+
+# NumPy is imported with NoteStore, only after the arguments are parsed, so a missing NumPy
+# is a usage error instead of a traceback
+
+def dir_path(path):
+    if os.path.isdir(path):
+        return path
+    else:
+        raise argparse.ArgumentTypeError(f"readable_dir:{path} is not a valid path")
+
+# a few numbers about the whole library, computed from the store alone
+def writeSummary(store, output):
+    import numpy as np
+    songs = store.songs
+    output.write('{} songs, {} notes\n'.format(len(songs), len(store)))
+    if not songs:
+        return
+    duets = sum(1 for song in songs if song['players'] > 1)
+    output.write('duets: {} ({:.1%})\n'.format(duets, duets / len(songs)))
+    bpms = np.array([song['bpm'] for song in songs if song['bpm'] is not None])
+    if len(bpms):
+        low, median, high = np.percentile(bpms, [25, 50, 75])
+        output.write('BPM: median {:.1f}, quartiles {:.1f}-{:.1f}\n'.format(median, low, high))
+    types = store.columns['type']
+    length = store.columns['length']
+    total = length[types != ord('F')].sum()
+    golden = length[types == ord('*')].sum()
+    if total:
+        # check's golden-ratio rule wants 1/17
+        output.write('golden beats: {:.2%} of {} beats (ideal {:.2%})\n'.format(golden / total, total, 1 / 17))
+    # broken files can have negative lengths, they are counted as 0
+    lengths = np.bincount(np.clip(length, 0, 16))
+    output.write('note lengths: ' + ', '.join(
+        '{}{}: {:.1%}'.format(n, '+' if n == 16 else '', count / len(length)) for n, count in enumerate(lengths) if count
+    ) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the notes of Ultrastar song directories into a columnar store')
+    parser.add_argument('store', type=str, help='Directory of the store, created if it does not exist')
+    parser.add_argument('directories', nargs='*', type=dir_path, help='Directories to look for txt files')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN', help='Skip directories whose name matches this pattern, can be given multiple times')
+    parser.add_argument('--dmx', action='append', default=[], type=dir_path, metavar='DIRECTORY', help='Directory with DMX config yml files, can be given multiple times')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files to parse in parallel (default: 1)')
+    parser.add_argument('--summary', action='store_true', help='Print songs, notes, duets, BPM, golden beats and note lengths of the store')
+    parser.add_argument('--audit', action='store_true', help='Print the findings of check\'s {}, {} and {} rules for every song in the store'.format(NoteOverlap.id, LinebreakPlacement.id, GoldenRatio.id))
+    parser.add_argument('-f', '--format', choices=['text', 'jsonl'], default='text', help='Output format of --audit (default: text)')
+    addStatsArguments(parser)
+    args = parser.parse_args()
+    if not args.directories and not args.summary and not args.audit:
+        parser.error('give directories to export, or --summary or --audit')
+    try:
+        from ultrastar_scripts.NoteStore import NoteStore
+    except ImportError:
+        parser.error('the note store needs NumPy, install it with pip install numpy')
+    profiled(args.profile, _run, args, NoteStore)
+
+def _run(args, NoteStore):
+    stats = statsFromArguments(args)
+    with phase(stats, 'load'):
+        store = NoteStore(args.store)
+    if args.directories:
+        from ultrastar_scripts.SonglistGenerator import SonglistGenerator
+        generator = SonglistGenerator(args.directories, args.dmx, ignore=args.ignore, stats=stats)
+        read, kept, removed, failed = store.update(args.directories, generator, args.ignore, args.jobs, stats)
+        sys.stderr.write('{} files read, {} unchanged, {} removed, {} failed\n'.format(read, kept, removed, failed))
+    if args.summary:
+        with phase(stats, 'summary'):
+            writeSummary(store, sys.stdout)
+    if args.audit:
+        # imported here, like NoteStore it needs NumPy
+        from ultrastar_scripts.check_report import writeJsonLines, writeText
+        from ultrastar_scripts.timing import auditStore
+        with phase(stats, 'audit'):
+            findings = auditStore(store)
+        with phase(stats, 'output'):
+            (writeJsonLines if args.format == 'jsonl' else writeText)(findings, sys.stdout)
+    if stats is not None:
+        stats.write(sys.stderr)
@@ -2,9 +2,16 @@ import argparse
 import sys
 import math
 
+from ultrastar_scripts.batch import addBatchArguments, runBatch
 from ultrastar_scripts.libultrastar import (
-    parseFloatLine,
-    minute_fraction_between_beats
+    Linebreak,
+    Note,
+    PlayerChange,
+    Tag,
+    parseFloat,
+    minute_fraction_between_beats,
+    tokenize,
+    writeEvents
 )
 
 def _optimal_linebreak(firstBeat: int, secondBeat: int, bpm: float):
@@ -34,33 +41,40 @@ def _optimal_linebreak(firstBeat: int, secondBeat: int, bpm: float):
     # default: 1/3rd
     return firstBeat + math.ceil((secondBeat - firstBeat)/3)
 
+# replaces every linebreak by one at the optimal position
+def fixLinebreaks(events):
+    bpm = 0
+    prevnote = None
+    linebreak = False
+    for event in events:
+        if isinstance(event, Linebreak):
+            linebreak = True
+        elif isinstance(event, Note):
+            if linebreak and prevnote:
+                # special handling if the last line was a linebreak
+                yield Linebreak(_optimal_linebreak(prevnote.end, event.start, bpm))
+            linebreak = False
+            # regular handling
+            yield event
+            prevnote = event
+        else:
+            yield event
+            if isinstance(event, Tag) and event.key == 'BPM':
+                bpm = parseFloat(event.value)
+            elif isinstance(event, PlayerChange):
+                # the next player starts over
+                prevnote = None
+                linebreak = False
+
 def main():
     parser = argparse.ArgumentParser(description='Fix linebreaks in Ultrastar txt files')
     parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
     parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    addBatchArguments(parser)
     args = parser.parse_args()
     output=args.output
 
-    bpm = 0
-    prevnoteline = ''
-    linebreak = False
-    for line in args.input.readlines():
-        if line.startswith('#'):
-            output.write(line)
-            if line.startswith('#BPM:'):
-                bpm = parseFloatLine(line)
-        elif line.startswith('E') or line.startswith('P'):
-            output.write(line)
-        elif line.startswith('-'):
-            linebreak = True
-        else:
-            if linebreak:
-                # special handling if the last line was a linebreak
-                prevparts = prevnoteline.split(' ', 3)
-                prevend = int(prevparts[1]) + int(prevparts[2])
-                start = int(line.split(' ')[1])
-                output.write('- ' + str(_optimal_linebreak(prevend, start, bpm)) + '\n')
-                linebreak = False
-            # regular handling
-            output.write(line)
-            prevnoteline = line
+    if args.batch:
+        return runBatch(args.batch, fixLinebreaks, args.jobs, args.dry_run)
+
+    writeEvents(fixLinebreaks(tokenize(args.input)), output)
@@ -1,24 +1,34 @@
 import argparse
 import sys
-import math
+
+from ultrastar_scripts.batch import addBatchArguments, runBatch
+from ultrastar_scripts.libultrastar import Note, tokenize, writeEvents
+
+# moves spaces at the end of a note to the start of the next note
+def fixWhitespace(events):
+    nextlinespace = False
+    for event in events:
+        if isinstance(event, Note):
+            original = event.text or ''
+            text = original.rstrip()
+            if nextlinespace and text:
+                text = ' ' + text
+            # a note without text gets no separator, a pending space moves on to the next note
+            yield Note(event.type, event.start, event.length, event.pitch, text or None)
+            nextlinespace = (nextlinespace and not text) or original.endswith(' ')
+        else:
+            yield event
+            nextlinespace = False
 
 def main():
     parser = argparse.ArgumentParser(description='Fix Ultrastar txt end-of-line whitespace')
-    parser.add_argument('input', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
+    parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
     parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    addBatchArguments(parser)
     args = parser.parse_args()
     output=args.output
 
-    nextlinespace = False
-    for line in args.input.readlines():
-        if line.startswith('#') or line.startswith('E') or line.startswith('P') or line.startswith('-'):
-            output.write(line)
-            nextlinespace = False
-        else:
-            if nextlinespace:
-                parts = line.split(' ', 4)
-                parts[4] = ' '+parts[4].rstrip()
-                output.write(' '.join(parts)+'\n')
-            else:
-                output.write(line.rstrip()+'\n')
-            nextlinespace = line.rstrip('\n').endswith(' ')
+    if args.batch:
+        return runBatch(args.batch, fixWhitespace, args.jobs, args.dry_run)
+
+    writeEvents(fixWhitespace(tokenize(args.input)), output)
@@ -1,3 +1,16 @@
+import codecs
+import heapq
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from fnmatch import fnmatch
+from itertools import islice
+from pathlib import Path
+
 def parseFloatLine(line: str) -> float:
     return parseFloat(line.split(':', 1)[1])
 
@@ -23,9 +36,415 @@ def minute_fraction_between_beats(firstBeat: int, secondBeat: int, bpm: float) -
         raise ValueError('secondBeat (' + str(secondBeat) + ') must be equal to or greater than firstBeat (' + str(firstBeat) + ')')
     return (secondBeat - firstBeat) / (bpm*4)
 
+# parsing
+# Every line of a txt file becomes one event. Events keep the line they were parsed from
+# so unchanged events are written back as-is; events created from scratch (line is None)
+# are formatted from their fields instead.
+class Event:
+    __slots__ = ('index', 'line')
+
+    def __init__(self, index: int = None, line: str = None):
+        # index is the 0-based line number
+        self.index = index
+        self.line = line
+
+    def __str__(self):
+        if self.line is None:
+            return self.format()
+        return self.line
+
+    def format(self) -> str:
+        raise NotImplementedError
+
+class Tag(Event):
+    __slots__ = ('key', 'value')
+
+    def __init__(self, key: str, value: str, index: int = None, line: str = None):
+        super().__init__(index, line)
+        self.key = key
+        # stripped, or None if the line has no colon
+        self.value = value
+
+    def format(self) -> str:
+        if self.value is None:
+            return '#{}\n'.format(self.key)
+        return '#{}:{}\n'.format(self.key, self.value)
+
+class Note(Event):
+    __slots__ = ('type', 'start', 'length', 'pitch', 'text')
+
+    def __init__(self, type: str, start: int, length: int, pitch: int, text: str, index: int = None, line: str = None):
+        super().__init__(index, line)
+        self.type = type
+        self.start = start
+        self.length = length
+        self.pitch = pitch
+        # None if the line ends after the pitch, '' if it has an empty text field
+        self.text = text
+
+    @property
+    def end(self) -> int:
+        return self.start + self.length
+
+    def format(self) -> str:
+        if self.text is None:
+            return '{} {} {} {}\n'.format(self.type, self.start, self.length, self.pitch)
+        return '{} {} {} {} {}\n'.format(self.type, self.start, self.length, self.pitch, self.text)
+
+class Linebreak(Event):
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start: int, end: int = None, index: int = None, line: str = None):
+        super().__init__(index, line)
+        self.start = start
+        # only used by files with relative timings
+        self.end = end
+
+    def format(self) -> str:
+        if self.end is None:
+            return '- {}\n'.format(self.start)
+        return '- {} {}\n'.format(self.start, self.end)
+
+class PlayerChange(Event):
+    __slots__ = ('player',)
+
+    def __init__(self, player: int, index: int = None, line: str = None):
+        super().__init__(index, line)
+        self.player = player
+
+    def format(self) -> str:
+        return 'P{}\n'.format(self.player)
+
+class End(Event):
+    __slots__ = ()
+
+    def format(self) -> str:
+        return 'E\n'
+
+# blank lines and anything else that is not part of the format
+class Unknown(Event):
+    __slots__ = ()
+
+    def format(self) -> str:
+        return '\n'
+
+NOTE_TYPES = frozenset((':', '*', 'F', 'R', 'G'))
+
+# lazily turns lines into events, so callers can stop reading early
+def tokenize(lines):
+    for index, line in enumerate(lines):
+        content = line.rstrip('\r\n')
+        if index == 0 and content.startswith('\ufeff'):
+            # remove BOM
+            content = content[1:]
+        first = content[:1]
+        if first == '#':
+            key, colon, value = content[1:].partition(':')
+            yield Tag(key, value.strip() if colon else None, index, line)
+        elif first in NOTE_TYPES:
+            parts = content.split(' ', 4)
+            yield Note(
+                parts[0],
+                int(parts[1]),
+                int(parts[2]),
+                int(parts[3]),
+                parts[4] if len(parts) > 4 else None,
+                index,
+                line
+            )
+        elif first == '-':
+            parts = content.split()
+            yield Linebreak(int(parts[1]), int(parts[2]) if len(parts) > 2 else None, index, line)
+        elif first == 'P':
+            yield PlayerChange(int(content[1:]), index, line)
+        elif first == 'E':
+            yield End(index, line)
+        else:
+            yield Unknown(index, line)
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# Encodings: a BOM or an #ENCODING tag (UTF8, CP1252, CP1250, ... as written by UltraStar
+# Deluxe) decides the codec. Without either, a file is UTF-8 if it decodes as UTF-8 and
+# FALLBACK_ENCODING otherwise, which is what most older songs use. Decoding never fails,
+# bytes that the fallback does not know become U+FFFD.
+
+FALLBACK_ENCODING = 'cp1252'
+
+# the -sig and utf-16 codecs remove the BOM when decoding and write it again when encoding
+BOMS = ((UTF8_BOM, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+_ENCODING_TAG = re.compile(rb'^#ENCODING:([^\r\n]*)', re.MULTILINE)
+
+# path -> (mtime, size, codec) of the files read last, so a file that needs the fallback is
+# not tried as UTF-8 again while it is unchanged. Least recently read paths are dropped
+# after ENCODING_CACHE_SIZE, so a long --watch or service run does not grow without bound.
+# Songlist workers read from threads, hence the lock.
+ENCODING_CACHE_SIZE = 65536
+_encodings = OrderedDict()
+_encodingsLock = threading.Lock()
+
+def _tagEncoding(value: bytes) -> str:
+    name = value.strip().decode('ascii', 'replace')
+    if name.upper() in ('', 'AUTO', 'LOCALE'):
+        return None
+    try:
+        codec = codecs.lookup(name).name
+    except LookupError:
+        return None
+    # a tag that can be read as ASCII rules these out, they are only recognized by their BOM
+    if codec.startswith(('utf-16', 'utf-32')):
+        return None
+    return codec
+
+# returns the codec that the BOM or #ENCODING tag in the first bytes of a file ask for, or
+# None if they do not say
+def detectEncoding(head: bytes) -> str:
+    for bom, codec in BOMS:
+        if head.startswith(bom):
+            return codec
+    match = _ENCODING_TAG.search(head)
+    if match:
+        return _tagEncoding(match.group(1))
+    return None
+
+# returns the text and the codec it was decoded with; encoding is the codec to try first,
+# by default the one the file asks for
+def decodeSong(data: bytes, encoding: str = None) -> (str, str):
+    if encoding is None:
+        encoding = detectEncoding(data[:4096])
+    for codec in (encoding, 'utf-8'):
+        if codec is not None:
+            try:
+                return data.decode(codec), codec
+            except UnicodeDecodeError:
+                # a wrong tag, try as if there was none
+                pass
+    return data.decode(FALLBACK_ENCODING, 'replace'), FALLBACK_ENCODING
+
+def _cachedEncoding(path, stat: os.stat_result) -> str:
+    with _encodingsLock:
+        cached = _encodings.get(os.fspath(path))
+    if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+        return None
+    return cached[2]
+
+def _cacheEncoding(path, stat: os.stat_result, codec: str):
+    key = os.fspath(path)
+    with _encodingsLock:
+        _encodings[key] = (stat.st_mtime_ns, stat.st_size, codec)
+        _encodings.move_to_end(key)
+        if len(_encodings) > ENCODING_CACHE_SIZE:
+            _encodings.popitem(last=False)
+
+# Reads and decodes a whole file at once, returns the text without BOM and the codec. The
+# codec can be used to write the file back as it was, BOM included.
+def readSong(path) -> (str, str):
+    with open(path, 'rb') as reader:
+        stat = os.fstat(reader.fileno())
+        data = reader.read()
+    text, codec = decodeSong(data, _cachedEncoding(path, stat))
+    _cacheEncoding(path, stat, codec)
+    return text, codec
+
+# the lines of a file, split and with line endings translated like open() in text mode does
+def readLines(path) -> [str]:
+    return io.StringIO(readSong(path)[0], newline=None).readlines()
+
+# Reads only the tags at the start of a file, in binary mode and a block at a time, and stops
+# at the first line that is not a tag. Only the values of the requested keys are decoded, all
+# at once when the header is read; encoding overrides the detection.
+def readHeader(path, keys, blocksize: int = 4096, encoding: str = None) -> dict:
+    wanted = {key.encode('ascii') for key in keys}
+    values = {}
+    with open(path, 'rb') as reader:
+        buffer = reader.read(blocksize)
+        stat = os.fstat(reader.fileno())
+        declared = encoding or _cachedEncoding(path, stat) or detectEncoding(buffer)
+        if declared == 'utf-16':
+            # not ASCII compatible, so the bytes cannot be searched for tags
+            return {event.key: event.value for event in _headerTags(readLines(path)) if event.key in keys and event.value is not None}
+        if buffer.startswith(UTF8_BOM):
+            buffer = buffer[len(UTF8_BOM):]
+        start = 0
+        while True:
+            newline = buffer.find(b'\n', start)
+            if newline == -1:
+                more = reader.read(blocksize)
+                if more:
+                    buffer = buffer[start:] + more
+                    start = 0
+                    continue
+                # last line of the file
+                newline = len(buffer)
+            line = buffer[start:newline]
+            if not line.startswith(b'#'):
+                break
+            key, colon, value = line[1:].partition(b':')
+            if colon:
+                if key in wanted:
+                    values[key.decode('ascii')] = value.strip()
+                elif key == b'ENCODING' and declared is None:
+                    # further down than the first block
+                    declared = _tagEncoding(value)
+            if newline >= len(buffer):
+                break
+            start = newline + 1
+    # values never contain a newline, so they are decoded in one go and split again
+    text, codec = decodeSong(b'\n'.join(values.values()), declared)
+    if declared is not None or codec != 'utf-8':
+        # valid UTF-8 in the header says nothing about the rest of the file
+        _cacheEncoding(path, stat, codec)
+    return dict(zip(values, text.split('\n')))
+
+def _headerTags(lines):
+    for event in tokenize(lines):
+        if not isinstance(event, Tag):
+            break
+        yield event
+
+# discovery
+def _scanDirectory(path: str, ignore) -> ([Path], [str]):
+    files = []
+    directories = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not any(fnmatch(entry.name, pattern) for pattern in ignore):
+                        directories.append(entry.path)
+                elif entry.name.endswith('.txt'):
+                    files.append(Path(entry.path))
+    except OSError:
+        # unreadable directories are skipped, like Path.glob does
+        pass
+    return files, directories
+
+# Yields every txt file below the given directories, as soon as its directory has been scanned.
+# Directories are scanned by a thread pool, which mostly helps on network storage. Directories
+# whose name matches one of the ignore patterns (fnmatch) are not descended into.
+# The order of the files is not defined.
+def findSongFiles(paths: [str], ignore: [str] = (), workers: int = 8):
+    # imported here, the transform scripts read a single stream and should start fast
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    ignore = tuple(ignore or ())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scanDirectory, path, ignore) for path in paths}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, directories = future.result()
+                    for directory in directories:
+                        pending.add(executor.submit(_scanDirectory, directory, ignore))
+                    yield from files
+        finally:
+            # the consumer may stop early
+            for future in pending:
+                future.cancel()
+
 # output
+# Writes events as they come in, batched into writelines calls: memory stays constant
+# for any input size and the first lines are written before the input has been read.
+def writeEvents(events, output, batchsize: int = 256):
+    lines = map(str, events)
+    while True:
+        batch = list(islice(lines, batchsize))
+        if not batch:
+            break
+        output.writelines(batch)
+
 def print_error(*args, **kwargs):
     from sys import stderr
     if 'file' in kwargs:
         del kwargs['file']
     print(*args, file=stderr, **kwargs)
+
+# timing
+# Hooks for --stats: a Stats object adds up the wall and CPU time per phase and keeps the
+# slowest files. Code that takes an optional stats argument wraps a phase in
+# `with phase(stats, 'name'):`, which does nothing when stats is None.
+class Stats:
+    def __init__(self, slowest: int = 10):
+        self.slowest = slowest
+        # name -> [wall seconds, cpu seconds], in the order the phases were first seen
+        self.phases = {}
+        self.files = 0
+        self.__slowest = []
+        self.__wall = time.perf_counter()
+        self.__cpu = self.__cpuTotal()
+
+    # including worker processes that have finished
+    @staticmethod
+    def __cpuTotal() -> float:
+        return sum(os.times()[:4])
+
+    def add(self, name: str, wall: float, cpu: float):
+        totals = self.phases.setdefault(name, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    @contextmanager
+    def phase(self, name: str):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    # seconds is the time spent on the file over all phases
+    def addFile(self, path, seconds: float):
+        self.files += 1
+        entry = (seconds, str(path))
+        if len(self.__slowest) < self.slowest:
+            heapq.heappush(self.__slowest, entry)
+        elif self.__slowest and entry > self.__slowest[0]:
+            heapq.heapreplace(self.__slowest, entry)
+
+    # yields from iterable, the time spent waiting for the next item counts as phase name
+    def iterate(self, name: str, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def write(self, output):
+        wall = time.perf_counter() - self.__wall
+        cpu = self.__cpuTotal() - self.__cpu
+        output.write('{:<16}{:>10}{:>10}\n'.format('phase', 'wall', 'cpu'))
+        for name, (phasewall, phasecpu) in self.phases.items():
+            output.write('{:<16}{:9.3f}s{:9.3f}s\n'.format(name, phasewall, phasecpu))
+        output.write('{:<16}{:9.3f}s{:9.3f}s\n'.format('total', wall, cpu))
+        output.write('{} files, {:.0f} files/s\n'.format(self.files, self.files / wall if wall else 0))
+        if self.__slowest:
+            output.write('slowest files:\n')
+            for seconds, path in sorted(self.__slowest, reverse=True):
+                output.write('{:9.3f}s {}\n'.format(seconds, path))
+
+def phase(stats: Stats, name: str):
+    return nullcontext() if stats is None else stats.phase(name)
+
+def addStatsArguments(parser):
+    parser.add_argument('--stats', action='store_true', help='Print the time spent per phase and the slowest files to standard error')
+    parser.add_argument('--slowest', type=int, default=10, metavar='N', help='Number of slowest files shown by --stats (default: 10)')
+    parser.add_argument('--profile', metavar='FILE', help='Run under cProfile and write the profile to FILE, for use with pstats or snakeviz (only covers the main process)')
+
+# returns a Stats object if --stats was given, otherwise None
+def statsFromArguments(args) -> Stats:
+    return Stats(args.slowest) if args.stats else None
+
+# calls function(*args), under cProfile if a profile file is given
+def profiled(profile: str, function, *args):
+    if profile is None:
+        return function(*args)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(profile)
@@ -1,8 +1,16 @@
 import argparse
 import sys
-import math
+from functools import partial
 
-from ultrastar_scripts.libultrastar import parseFloatLine
+from ultrastar_scripts.batch import addBatchArguments, runBatch
+from ultrastar_scripts.libultrastar import (
+    Linebreak,
+    Note,
+    Tag,
+    parseFloat,
+    tokenize,
+    writeEvents
+)
 
 # rounds the bpm to 0, 1 or 2 digits, whatever is necessary
 def roundBpmTag(bpm: float) -> str:
@@ -11,27 +19,37 @@ def roundBpmTag(bpm: float) -> str:
         return rounded[:-2]
     return rounded
 
+def multiplyBpm(events, multiplier: float):
+    for event in events:
+        if isinstance(event, Tag) and event.key == 'BPM':
+            yield Tag('BPM', roundBpmTag(parseFloat(event.value)*multiplier))
+        elif isinstance(event, Linebreak):
+            yield Linebreak(
+                round(event.start*multiplier),
+                None if event.end is None else round(event.end*multiplier)
+            )
+        elif isinstance(event, Note):
+            yield Note(
+                event.type,
+                round(event.start*multiplier),
+                round(event.length*multiplier),
+                event.pitch,
+                event.text
+            )
+        else:
+            yield event
+
 def main():
     parser = argparse.ArgumentParser(description='Multiply BPM in Ultrastar txt files')
     parser.add_argument('multiplier', type=float, help='Multiplier')
     parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
     parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    addBatchArguments(parser)
     args = parser.parse_args()
     output = args.output
     multiplier = args.multiplier
 
-    for line in args.input.readlines():
-        if line.startswith('#') or line.startswith('E'):
-            if (line.startswith('#BPM:')):
-                output.write('#BPM:' + roundBpmTag(parseFloatLine(line)*multiplier)+'\n')
-            else:
-                output.write(line)
-        elif line.startswith('-'):
-            output.write('- ' + ' '.join(map(lambda b: str(round(float(b)*multiplier)), line.split(' ')[1:]))+'\n')
-        else:
-            parts = line.split(' ', 3)
-            noteType = parts[0]
-            start = str(round(float(parts[1])*multiplier))
-            length = str(round(float(parts[2])*multiplier))
-            rest = parts[3]
-            output.write(noteType+' '+start+' '+length+' '+rest)
+    if args.batch:
+        return runBatch(args.batch, partial(multiplyBpm, multiplier=multiplier), args.jobs, args.dry_run)
+
+    writeEvents(multiplyBpm(tokenize(args.input), multiplier), output)
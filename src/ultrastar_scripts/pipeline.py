@@ -0,0 +1,78 @@
+import argparse
+import sys
+from functools import partial
+
+from ultrastar_scripts.batch import addBatchArguments, runBatch
+from ultrastar_scripts.fix_linebreaks import fixLinebreaks
+from ultrastar_scripts.fix_whitespace import fixWhitespace
+from ultrastar_scripts.libultrastar import tokenize, writeEvents
+from ultrastar_scripts.multiply_bpm import multiplyBpm
+from ultrastar_scripts.split_lyrics import splitLyrics
+
+# Chains the transform scripts in one process: the input is parsed once, every stage works on
+# the events of the previous one and the result is written once.
+#
+#   from ultrastar_scripts.pipeline import compose, stage
+#   transform = compose(stage('fix-linebreaks'), stage('split-lyrics', '_'))
+#   for event in transform(tokenize(lines)): ...
+
+def _splitSeparator(separator: str) -> str:
+    if separator not in ('_', '+'):
+        raise ValueError('separator must be _ or +')
+    return separator
+
+# name: (stage function, keyword and converter of its argument or None)
+STAGES = {
+    'fix-linebreaks': (fixLinebreaks, None),
+    'fix-whitespace': (fixWhitespace, None),
+    'multiply-bpm': (multiplyBpm, ('multiplier', float)),
+    'split-lyrics': (splitLyrics, ('separator', _splitSeparator))
+}
+
+def stage(name: str, argument: str = None):
+    if name not in STAGES:
+        raise ValueError('unknown stage ' + name + ', choose from ' + ', '.join(STAGES))
+    function, parameter = STAGES[name]
+    if parameter is None:
+        if argument is not None:
+            raise ValueError(name + ' does not take an argument')
+        return function
+    if argument is None:
+        raise ValueError(name + ' needs an argument, for example ' + name + ':' + {'multiplier': '2', 'separator': '_'}[parameter[0]])
+    keyword, converter = parameter
+    return partial(function, **{keyword: converter(argument)})
+
+def _apply(events, stages):
+    for s in stages:
+        events = s(events)
+    return events
+
+# one transform out of several stages, picklable so it can be used in batch mode
+def compose(*stages):
+    return partial(_apply, stages=stages)
+
+# argparse type for NAME or NAME:ARGUMENT
+def _parseStage(spec: str):
+    name, colon, argument = spec.partition(':')
+    try:
+        return stage(name, argument if colon else None)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run several transformations on Ultrastar txt files in one go',
+        epilog='Stages: fix-linebreaks, fix-whitespace, multiply-bpm:MULTIPLIER, split-lyrics:SEPARATOR'
+    )
+    parser.add_argument('stages', nargs='+', type=_parseStage, metavar='STAGE', help='Stages to run, in order')
+    parser.add_argument('-i', '--input', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    addBatchArguments(parser)
+    args = parser.parse_args()
+    output = args.output
+    transform = compose(*args.stages)
+
+    if args.batch:
+        return runBatch(args.batch, transform, args.jobs, args.dry_run)
+
+    writeEvents(transform(tokenize(args.input)), output)
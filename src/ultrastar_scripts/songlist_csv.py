@@ -1,6 +1,7 @@
 import argparse
 import sys
 import os
+from ultrastar_scripts.libultrastar import addStatsArguments, phase, profiled, statsFromArguments
 from ultrastar_scripts.SonglistGenerator import SonglistGenerator
 
 def dir_path(path):
@@ -13,10 +14,30 @@ def main():
     parser = argparse.ArgumentParser(description='Create a csv songlist from Ultrastar song directories')
     parser.add_argument('directories', nargs='+', type=dir_path, help='Directories to look for txt files')
     parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN', help='Skip directories whose name matches this pattern, can be given multiple times')
+    parser.add_argument('--index', type=str, help='Index file, only files that changed since the previous run are read again')
+    parser.add_argument('--dmx', action='append', default=[], type=dir_path, metavar='DIRECTORY', help='Directory with DMX config yml files, can be given multiple times')
+    parser.add_argument('--dmx-cache', type=str, metavar='FILE', help='Compiled DMX config, only yml files that changed since the previous run are parsed again')
+    parser.add_argument('--dmx-jobs', type=int, default=1, metavar='N', help='Number of yml files to parse in parallel (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=1, metavar='N', help='Number of txt files to read at the same time, for libraries on network shares (default: 1)')
+    addStatsArguments(parser)
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    profiled(args.profile, _run, args)
+
+def _run(args):
     output = args.output
     directories = args.directories
 
-    sg = SonglistGenerator(directories)
-    sg.generate()
-    sg.writeCsv(output)
+    stats = statsFromArguments(args)
+    sg = SonglistGenerator(directories, args.dmx, args.index, args.ignore, stats, args.dmx_cache, args.dmx_jobs)
+    if args.concurrency > 1:
+        import asyncio
+        asyncio.run(sg.generate_async(args.concurrency))
+    else:
+        sg.generate()
+    with phase(stats, 'output'):
+        sg.writeCsv(output)
+    if stats is not None:
+        stats.write(sys.stderr)
@@ -1,62 +1,71 @@
 import argparse
 import sys
 import math
+from functools import partial
 
-def main():
-    parser = argparse.ArgumentParser(description='Split lyrics in Ultrastar txt files')
-    parser.add_argument('separator', type=str, choices=['_', '+'], help='Separator (_ for words or + for syllables)')
-    parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
-    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
-    args = parser.parse_args()
-    output = args.output
-    separator = args.separator
+from ultrastar_scripts.batch import addBatchArguments, runBatch
+from ultrastar_scripts.libultrastar import Note, tokenize, writeEvents
 
+def splitLyrics(events, separator: str):
     replacer = {'_': ' ', '+': ''}.get(separator)
-
-    for line in args.input.readlines():
-        if line.startswith(':') or line.startswith('F') or line.startswith('*') or line.startswith('R'):
+    for event in events:
+        if isinstance(event, Note):
             # splitting
-            parts = line.strip().split(' ', 4)
-            content = parts[4]
-            # performance: if the content does not contain the separator, just dump the line
+            content = (event.text or '').rstrip()
+            # performance: if the content does not contain the separator, just pass it through
             if separator not in content:
-                output.write(line)
+                yield event
             else:
                 # we need to actually do something here
-                noteType = parts[0]
-                start = int(parts[1])
-                length = int(parts[2])
-                pitch = parts[3]
+                noteType = event.type
+                start = event.start
+                length = event.length
+                pitch = event.pitch
                 contents = content.split(separator)
                 num = len(contents)
                 optimalLength = math.floor(length / num)
                 # first one
-                output.write('{} {} {} {} {}\n'.format(
+                yield Note(
                     noteType,
                     start,
                     optimalLength-1,
                     pitch,
                     # no replacer on the first one!
                     contents[0]
-                ))
+                )
                 # middle
                 for i, c in enumerate(contents[1:-1], 1):
-                    output.write('{} {} {} {} {}\n'.format(
+                    yield Note(
                         noteType,
                         start + i*optimalLength,
                         optimalLength-1,
                         pitch,
                         replacer+c
-                    ))
+                    )
                 # and write last
                 lastStart = start + (num -1)*optimalLength
                 lastLength = start + length - lastStart
-                output.write('{} {} {} {} {}\n'.format(
+                yield Note(
                     noteType,
                     lastStart,
                     lastLength,
                     pitch,
                     replacer+contents[-1]
-                ))
+                )
         else:
-            output.write(line)
+            yield event
+
+def main():
+    parser = argparse.ArgumentParser(description='Split lyrics in Ultrastar txt files')
+    parser.add_argument('separator', type=str, choices=['_', '+'], help='Separator (_ for words or + for syllables)')
+    parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin, help='Input file (default: standard input)')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout, help='Output file (default: standard output)')
+    addBatchArguments(parser)
+    args = parser.parse_args()
+    output = args.output
+    separator = args.separator
+
+    if args.batch:
+        return runBatch(args.batch, partial(splitLyrics, separator=separator), args.jobs, args.dry_run)
+
+    writeEvents(splitLyrics(tokenize(args.input), separator), output)
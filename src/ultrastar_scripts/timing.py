@@ -0,0 +1,141 @@
+import numpy as np
+
+from ultrastar_scripts.check_report import Finding
+from ultrastar_scripts.check_rules import RULES, GoldenRatio, LinebreakPlacement, NoteOverlap
+
+# Timing analysis on NumPy arrays, for a whole library at once: the notes of every song are
+# columns of a NoteStore, and linebreak positions, overlaps and golden beats are computed for
+# all of them in one go. The results are the same as those of the rules in check_rules and of
+# fix_linebreaks, which work note by note. NumPy is optional, this module is only imported by
+# export-notes.
+
+# the rules that auditStore computes
+RULES_AUDITED = (NoteOverlap.id, LinebreakPlacement.id, GoldenRatio.id)
+
+# linebreak categories after the one for 2-8 beats, in the order fix_linebreaks checks them
+MEDIUM, LONG, FOUR_SECONDS, TWO_SECONDS, SIXTEEN_BEATS, DEFAULT = range(6)
+
+# returns the end of the preceding note of the same segment, and a mask of the notes that
+# have none (the first note of a song or after a player change)
+def previousEnds(start: np.ndarray, length: np.ndarray, segment: np.ndarray) -> (np.ndarray, np.ndarray):
+    first = np.ones(len(start), dtype=bool)
+    first[1:] = segment[1:] != segment[:-1]
+    prevend = np.zeros(len(start), dtype=np.int64)
+    prevend[1:] = start[:-1] + length[:-1]
+    return prevend, first
+
+# the notes that start before the end of the preceding note
+def overlaps(start: np.ndarray, prevend: np.ndarray, first: np.ndarray) -> np.ndarray:
+    return ~first & (start < prevend)
+
+# The category and the optimal linebreak of the branch after the one for 2-8 beats,
+# see fix_linebreaks._optimal_linebreak. Only meaningful where prevend <= start and bpm > 0,
+# for which minute_fraction_between_beats raises.
+def _longPauses(prevend: np.ndarray, start: np.ndarray, bpm: np.ndarray) -> (np.ndarray, np.ndarray):
+    pause = start - prevend
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = pause / (bpm*4)
+    conditions = [
+        (pause >= 9) & (pause <= 12),
+        (pause >= 13) & (pause <= 16),
+        fraction > 0.066,
+        fraction > 0.033,
+        pause > 16
+    ]
+    category = np.select(conditions, [MEDIUM, LONG, FOUR_SECONDS, TWO_SECONDS, SIXTEEN_BEATS], DEFAULT)
+    # round() and np.round() both round halves to even
+    optimal = np.select(conditions, [
+        start - 3,
+        start - 4,
+        prevend + np.round(bpm/7.5).astype(np.int64),
+        prevend + np.floor(bpm/15).astype(np.int64),
+        prevend + 10
+    ], prevend + np.ceil(pause/3).astype(np.int64))
+    return category, optimal
+
+# the beats of all notes except freestyle ones and of the golden ones, per group (a player
+# of a song); type holds the note types as bytes, like the columns of a NoteStore
+def goldenBeats(length: np.ndarray, type: np.ndarray, group: np.ndarray, groups: int) -> (np.ndarray, np.ndarray):
+    total = np.bincount(group, weights=length * (type != ord('F')), minlength=groups)
+    golden = np.bincount(group, weights=length * (type == ord('*')), minlength=groups)
+    return total.astype(np.int64), golden.astype(np.int64)
+
+_PLACEMENT = {
+    MEDIUM: 'pause is 9-12 beats, so linebreak 3 beats before (beat {})',
+    LONG: 'pause is 13-16 beats, so linebreak 4 beats before (beat {})',
+    FOUR_SECONDS: 'pause is more than 4s, so linebreak after 2s (beat {})',
+    TWO_SECONDS: 'pause is more than 2s, so linebreak after 1s (beat {})',
+    SIXTEEN_BEATS: 'pause is more than 16 beats but less than 1s, so linebreak after 10 beats (beat {})'
+}
+
+# The findings of the rules in RULES_AUDITED for every song of store, ordered like check
+# orders them within a file: by line and rule, findings about the whole file last. store is a
+# NoteStore.
+def auditStore(store, rules: [str] = RULES_AUDITED) -> [Finding]:
+    songs = store.songs
+    columns = store.columns
+    counts = np.array([song['count'] for song in songs], dtype=np.int64)
+    # the position in songs of the song of every note
+    songIndex = np.repeat(np.arange(len(songs)), counts)
+    start = columns['start'].astype(np.int64)
+    length = columns['length'].astype(np.int64)
+    player = columns['player'].astype(np.int64)
+    line = columns['line']
+    linebreak = columns['linebreak'].astype(np.int64)
+    bpm = np.repeat(np.array([song['bpm'] or 0 for song in songs], dtype=np.float64), counts)
+    # a new segment starts with every song and every P line
+    prevend, first = previousEnds(start, length, np.cumsum(columns['first'], dtype=np.int64))
+
+    # (song, line, rule, message) of the findings about one note
+    found = []
+    if NoteOverlap.id in rules:
+        mask = overlaps(start, prevend, first)
+        found.append((songIndex[mask], line[mask], 0, ['note starts too early'] * int(mask.sum())))
+    if LinebreakPlacement.id in rules:
+        # the notes LinebreakPlacement.onNoteAfterLinebreak is called for and does not skip
+        checked = ~first & (linebreak != store.NO_LINEBREAK) & (start >= prevend) & (bpm > 0)
+        pause = start - prevend
+        # like the rule, 2-8 beats is checked on its own and not as part of the chain
+        short = checked & (pause >= 2) & (pause <= 8) & (linebreak != start - 2)
+        found.append((songIndex[short], line[short], 1, [
+            'pause is 2-8 beats, so linebreak 2 beats before (beat {})'.format(optimal) for optimal in (start - 2)[short].tolist()
+        ]))
+        category, optimal = _longPauses(prevend, start, bpm)
+        misplaced = checked & (category != DEFAULT) & (linebreak != optimal)
+        found.append((songIndex[misplaced], line[misplaced], 1, [
+            _PLACEMENT[category].format(optimal) for category, optimal in zip(category[misplaced].tolist(), optimal[misplaced].tolist())
+        ]))
+    songFindings = [[] for i in songs]
+    if found:
+        songColumn = np.concatenate([f[0] for f in found])
+        lineColumn = np.concatenate([f[1] for f in found])
+        ruleColumn = np.concatenate([np.full(len(f[0]), f[2]) for f in found])
+        messages = [message for f in found for message in f[3]]
+        ids = (NoteOverlap.id, LinebreakPlacement.id)
+        # stable, so findings of one rule for the same line keep their order
+        for n in np.lexsort((ruleColumn, lineColumn, songColumn)).tolist():
+            id = ids[ruleColumn[n]]
+            songFindings[songColumn[n]].append(Finding(id, songs[songColumn[n]]['path'], int(lineColumn[n]), RULES[id].severity, messages[n]))
+    if GoldenRatio.id in rules:
+        _golden(songs, songIndex, length, columns['type'], player, songFindings)
+    return [finding for findings in songFindings for finding in findings]
+
+# the golden-ratio findings of every song, per player like GoldenRatio
+def _golden(songs: [dict], songIndex: np.ndarray, length: np.ndarray, type: np.ndarray, player: np.ndarray, songFindings: [list]):
+    players = np.array([song['players'] for song in songs], dtype=np.int64)
+    # one group per player of every song
+    firstGroup = np.zeros(len(songs) + 1, dtype=np.int64)
+    np.cumsum(players, out=firstGroup[1:])
+    group = firstGroup[songIndex] + player - 1
+    total, golden = goldenBeats(length, type, group, int(firstGroup[-1]))
+    ideal = np.round(total / 17).astype(np.int64)
+    total, golden, ideal, firstGroup = total.tolist(), golden.tolist(), ideal.tolist(), firstGroup.tolist()
+    for n, song in enumerate(songs):
+        for number in range(1, song['players'] + 1):
+            g = firstGroup[n] + number - 1
+            if golden[g] != ideal[g]:
+                message = 'ideal golden beats'
+                if song['players'] > 1:
+                    message += ' for P' + str(number)
+                songFindings[n].append(Finding(GoldenRatio.id, song['path'], None, GoldenRatio.severity,
+                                               message + ' = ' + str(ideal[g]) + ' (current = ' + str(golden[g]) + ')'))